@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import mmap
+import bz2
+import struct
+import numpy as np
+
+def usage(status=0):
+    ''' Display usage information and exit with specified status '''
+    progname = os.path.basename(sys.argv[0])
+    print(f'''Usage: {progname} [INDEX_FILE] [options]
+
+    [INDEX_FILE]                Article index table to create or add to, for parse_wiki.py -X
+
+    OPTIONS:
+    -h                          Display usage
+    -m [MULTISTREAM_INDEX]      Number every page of a multistream index, in file order, that the table does not have yet
+    -c                          Print the number of pages in the table and the next article number
+    ''')
+    sys.exit(status)
+
+# Article index table, the article number of every page ID numbered so far
+#
+#     MAGIC, uint64 number of pages, int64 next article number
+#     uint64 page IDs, sorted
+#     int64 article number of every page
+#
+# All numbers are little-endian. Opening only maps the file, so it takes the same time for a table of any size,
+# and page IDs are looked up without a pass over the dump.
+
+MAGIC = b'WIKIART1'
+HEADER = struct.Struct('<8sQq')
+ARTICLE_INDEX_EXTENSION = '.articles'
+
+class ArticleIndex:
+    '''
+    Gives every article a number the first time it has tuples, shared by the tuples, titles, columns and shards
+    Keys are page IDs, or titles when pages come without them, which can not be saved into a table
+    file_name : optional article index table, memory-mapped, its articles keep their number
+    start_index : number of the first article not in the table
+    '''
+    def __init__(self, file_name=None, start_index=0):
+        self.file_name = file_name
+        self.map = None
+        self.page_ids = np.zeros(0, dtype='<u8')
+        self.indices = np.zeros(0, dtype='<i8')
+        self.next_index = start_index
+        self.added = {} # Key -> article number of articles numbered since the table was opened
+        self.page_id = None # Page ID of the page keyed_pages passed on last
+        if file_name and os.path.exists(file_name) and os.path.getsize(file_name) > HEADER.size:
+            with open(file_name, 'rb') as read_file:
+                self.map = mmap.mmap(read_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, count, next_index = HEADER.unpack_from(self.map)
+            if magic != MAGIC:
+                self.map.close()
+                print(f'{file_name} is not an article index table')
+                sys.exit(1)
+            self.page_ids = np.frombuffer(self.map, dtype='<u8', count=count, offset=HEADER.size)
+            self.indices = np.frombuffer(self.map, dtype='<i8', count=count, offset=HEADER.size + 8 * count)
+            self.next_index = max(start_index, next_index)
+
+    def __len__(self):
+        return len(self.page_ids) + len(self.added)
+
+    def get(self, key):
+        '''Article number of key, or None if it has none yet'''
+        index = self.added.get(key)
+        if index is not None or not len(self.page_ids):
+            return index
+        position = int(np.searchsorted(self.page_ids, key))
+        if position < len(self.page_ids) and self.page_ids[position] == key:
+            return int(self.indices[position])
+        return None
+
+    def assign(self, key):
+        '''Article number of key, giving it the next one if it has none yet'''
+        index = self.get(key)
+        if index is None:
+            index = self.next_index
+            self.added[key] = index
+            self.next_index += 1
+        return index
+
+    def keyed_pages(self, pages):
+        '''Pass pages with the 'page id' the parser gave them, yields them without it, for assign_page to number them by page ID'''
+        for title, title_dict in pages:
+            self.page_id = title_dict.pop('page id')
+            yield title, title_dict
+        self.page_id = None
+
+    def assign_page(self, title):
+        '''Article number of the page keyed_pages passed on last, or of title when pages are not keyed'''
+        return self.assign(title if self.page_id is None else self.page_id)
+
+    def save(self, file_name=None):
+        '''Writes the table with the articles added into file_name, by default the file it was opened from'''
+        file_name = file_name or self.file_name
+        page_ids = np.concatenate([self.page_ids, np.fromiter(self.added.keys(), dtype='<u8', count=len(self.added))])
+        indices = np.concatenate([self.indices, np.fromiter(self.added.values(), dtype='<i8', count=len(self.added))])
+        order = np.argsort(page_ids, kind='stable')
+        # the table may be mapped from file_name, so replace it whole
+        with open(file_name + '.tmp', 'wb') as output_file:
+            output_file.write(HEADER.pack(MAGIC, len(order), self.next_index))
+            output_file.write(page_ids[order].tobytes())
+            output_file.write(indices[order].tobytes())
+        os.replace(file_name + '.tmp', file_name)
+        print(f'Saved {len(order)} article numbers to {file_name}, {len(self.added)} of them new')
+
+    def close(self):
+        if self.map is not None:
+            # views have to go before the map can close
+            self.page_ids = self.indices = None
+            self.map.close()
+            self.map = None
+
+def multistream_page_ids(index_file):
+    '''Yields the page ID of every line of a multistream index, in format offset:pageID:title'''
+    opener = bz2.open if index_file.endswith('.bz2') else open
+    with opener(index_file, 'rb') as read_file:
+        for line in read_file:
+            parts = line.split(b':', 2)
+            if len(parts) == 3:
+                yield int(parts[1])
+
+def number_multistream_pages(article_index, index_file):
+    '''Numbers every page of a multistream index in file order, so every article has its number before parsing'''
+    for page_id in multistream_page_ids(index_file):
+        article_index.assign(page_id)
+
+def main():
+    '''Parse command line options'''
+    arguments = sys.argv[1:]
+    if len(arguments) == 0:
+        usage(1)
+    file_name = arguments.pop(0)
+    if file_name == '-h':
+        usage(0)
+    article_index = ArticleIndex(file_name)
+    changed = False
+    while len(arguments) > 0:
+        arg = arguments.pop(0)
+        if arg == '-h':
+            usage(0)
+        elif arg == '-m':
+            number_multistream_pages(article_index, arguments.pop(0))
+            changed = True
+        elif arg == '-c':
+            print(f'{len(article_index)} pages, next article number {article_index.next_index}')
+        else:
+            usage(1)
+    if changed:
+        article_index.save()
+    article_index.close()
+
+# Main Execution
+if __name__ == '__main__':
+    main()
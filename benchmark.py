@@ -0,0 +1,640 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+import json
+import ijson
+import tempfile
+import itertools
+import subprocess
+import platform
+import pickle
+import bz2
+import gzip
+import shutil
+# include these scripts in same directory
+from xml_parse import bz2_generate_lines, gzip_generate_lines, PARSE_ENGINES, DIFF_MODES, parse_file, parse_timestamp
+import dateutil.parser as dp
+import wiki_parser3
+from page_store import write_pages, read_pages, read_page_index, read_page
+import decompress
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def usage(status=0, error_message=''):
+    ''' Display usage information and exit with specified status '''
+    progname = os.path.basename(sys.argv[0])
+    print(f'''Usage: {progname} [BENCHMARK] [options]
+
+    BENCHMARKS:
+    engines [DATA_FILE]         Compare MB/s of every xml parser engine on the same bz2 or gz dump
+    decompress [DATA_FILE]      MB/s of reading a bz2 or gz dump line by line from the stdlib file, and in chunks with every installed decompressor
+    diff [REVISIONS] [WORDS]    Per-revision cost of every engine, and of every -D diff mode, on one synthetic article. Default is 10000 revisions of 2000 words
+    words [DATA_FILE]           Speedup of the convert_to_words cache on dict_yield_tuples, over a bz2, gz or -f json file
+    normalize [DATA_FILE]       Check the single pass convert_to_words gives the same words as the HTMLParser one on every string of a bz2, gz or -f json file, and compare their tokens per second
+    wikitext [DATA_FILE]        Time and token count of parsing a bz2 or gz dump into sorted tuples with and without -W wikitext cleaning
+    formats [DATA_FILE]         Write and read speed of the json and binary page formats for the -f data of a bz2, gz or json file
+    timestamps [COUNT]          Speed of parse_timestamp against dateutil on random timestamps, checking both give the same UTC seconds. Default is 200000
+    generate [NAME] [PAGES] [REVISIONS] [WORDS] [MARKUP]
+                                Write a synthetic dump as NAME-pages-meta-history.xml.bz2 and .xml.gz, the same for the same arguments.
+                                Default is 1000 pages of 20 revisions of 500 words, a MARKUP fraction of 0.1 of them wikitext markup
+    incremental [PAGES] [REVISIONS] [WORDS]
+                                Check that an -I run over an older synthetic dump then the full one gives the same tuples and titles as
+                                a single run over the full dump, and compare their times. The older dump has the first half of the
+                                revisions of every page. Default is 1000 pages of 20 revisions of 500 words
+    suite [RESULTS_FILE] [PAGES] [REVISIONS] [WORDS] [MARKUP] [REPEATS]
+                                Time decompression, parsing, tuples, sorting and writing, then the -f, -t, -d, -s, -w and json input
+                                paths of parse_wiki.py, on a generated dump. Writes the best of REPEATS runs (default 3), sizes and
+                                the environment to RESULTS_FILE as json
+    compare [OLD_RESULTS] [NEW_RESULTS]
+                                Times of two suite results files side by side, with the speedup
+    ''')
+    if error_message:
+        print(f'ERROR: {error_message}')
+    sys.exit(status)
+
+def generate_lines(data_file):
+    '''Pick the line generator from the data file extension'''
+    if data_file.endswith('.bz2'):
+        return bz2_generate_lines(data_file)
+    elif data_file.endswith('.gz'):
+        return gzip_generate_lines(data_file)
+    usage(2, 'Data file must be bz2 or gz')
+
+def count_bytes(records_stream, counter):
+    '''Passes records through, adding their length to counter[0]'''
+    for record in records_stream:
+        counter[0] += len(record)
+        yield record
+
+def bench_engines(data_file):
+    '''Times decompression alone and then every parser engine over the same data file'''
+    counter = [0]
+    start = time.perf_counter()
+    for _ in count_bytes(generate_lines(data_file), counter):
+        pass
+    decompress_secs = time.perf_counter() - start
+    total_mb = counter[0] / 1e6
+    print(f'{"decompress only":<16} {decompress_secs:8.2f} s {total_mb / decompress_secs:8.2f} MB/s')
+
+    for engine, parse in PARSE_ENGINES.items():
+        pages = 0
+        revisions = 0
+        start = time.perf_counter()
+        for title, page in parse(generate_lines(data_file)):
+            pages += 1
+            revisions += page['number of ts']
+        secs = time.perf_counter() - start
+        # rate of the parser alone, with decompression time taken out
+        parse_secs = max(secs - decompress_secs, 1e-9)
+        print(f'{engine:<16} {secs:8.2f} s {total_mb / secs:8.2f} MB/s ({total_mb / parse_secs:.2f} MB/s parsing) {pages} pages {revisions} revisions')
+
+def bench_decompress(data_file):
+    '''Times iterating over the stdlib file line by line, then every decompressor of the chunked reader, over the same data file'''
+    if data_file.endswith('.bz2'):
+        file_type = 'bz2'
+    elif data_file.endswith('.gz'):
+        file_type = 'gz'
+    else:
+        usage(2, 'Data file must be bz2 or gz')
+
+    def stdlib_lines():
+        with decompress.STDLIB_OPENERS[file_type](data_file, 'rb') as read_file:
+            yield from read_file
+
+    backends = {'stdlib lines' : stdlib_lines, 'stdlib' : lambda: decompress.generate_lines(data_file, file_type, 'stdlib')}
+    for name, command in decompress.DECOMPRESSORS[file_type].items():
+        if shutil.which(command[0]):
+            backends[name] = lambda name=name: decompress.generate_lines(data_file, file_type, name)
+        else:
+            print(f'{name:<16} not installed')
+    print(f'auto picks {" ".join(decompress.find_decompressor(file_type, "auto") or ["stdlib"])}')
+
+    expected = None
+    for name, lines in backends.items():
+        counter = [0]
+        start = time.perf_counter()
+        count = drain(count_bytes(lines(), counter))
+        secs = time.perf_counter() - start
+        # every backend has to give the same lines
+        expected = expected or (count, counter[0])
+        check = '' if (count, counter[0]) == expected else ' MISMATCH'
+        print(f'{name:<16} {secs:8.2f} s {counter[0] / 1e6 / secs:8.2f} MB/s {count} lines{check}')
+
+def synthetic_article(revisions, words, seed=0):
+    '''Returns the xml lines, in bytes, of one article with the given number of revisions and words per revision'''
+    rand = random.Random(seed)
+    vocabulary = [f'word{i}' for i in range(words)]
+    text = [rand.choice(vocabulary) for _ in range(words)]
+    lines = [b'<mediawiki>\n', b'  <page>\n', b'    <title>Synthetic</title>\n', b'    <ns>0</ns>\n', b'    <id>1</id>\n']
+    for revision in range(revisions):
+        # every revision changes a few words
+        for _ in range(5):
+            text[rand.randrange(words)] = rand.choice(vocabulary)
+        lines.append(b'    <revision>\n')
+        lines.append(f'      <id>{revision + 1}</id>\n'.encode())
+        lines.append(f'      <timestamp>2010-01-01T00:00:{revision % 60:02d}Z</timestamp>\n'.encode())
+        text_lines = [' '.join(text[i:i + 10]) for i in range(0, words, 10)]
+        text_lines[0] = '      <text bytes="0" xml:space="preserve">' + text_lines[0]
+        text_lines[-1] += '</text>'
+        lines.extend(f'{line}\n'.encode() for line in text_lines)
+        lines.append(b'    </revision>\n')
+    lines.extend([b'  </page>\n', b'</mediawiki>\n'])
+    return lines
+
+def bench_diff(revisions, words):
+    '''Times every parser engine over one article with many revisions, reporting the cost per revision'''
+    lines = synthetic_article(revisions, words)
+    print(f'Synthetic article of {revisions} revisions, {words} words each')
+    for engine, parse in PARSE_ENGINES.items():
+        start = time.perf_counter()
+        for title, page in parse(lines):
+            pass
+        secs = time.perf_counter() - start
+        print(f'{engine:<16} {secs:8.2f} s {secs / revisions * 1e6:10.1f} us/revision')
+    # every diff mode with the default engine, against the set difference
+    parse = PARSE_ENGINES['lines']
+    mode_secs = {}
+    for diff in DIFF_MODES:
+        start = time.perf_counter()
+        for title, page in parse(lines, None, None, diff):
+            pass
+        mode_secs[diff] = time.perf_counter() - start
+        print(f'{"diff " + diff:<16} {mode_secs[diff]:8.2f} s {mode_secs[diff] / revisions * 1e6:10.1f} us/revision {mode_secs[diff] / mode_secs["set"]:6.2f}x set')
+
+def load_store(data_file):
+    '''Loads the parsed dictionary of a bz2, gz or json data file'''
+    if data_file.endswith('.json'):
+        with open(data_file, 'r') as read_file:
+            return json.load(read_file)
+    elif data_file.endswith('.bz2'):
+        return parse_file(data_file, 'bz2')
+    elif data_file.endswith('.gz'):
+        return parse_file(data_file, 'gz')
+    usage(2, 'Data file must be bz2, gz or json')
+
+def bench_words(data_file):
+    '''Times dict_yield_tuples with the convert_to_words cache off and on'''
+    store = load_store(data_file)
+    # every timestamp in range
+    min_timestamp, max_timestamp = 0, float('inf')
+    results = {}
+    for cache_size in (0, wiki_parser3.WORD_CACHE_SIZE):
+        wiki_parser3.set_word_cache_size(cache_size)
+        start = time.perf_counter()
+        tuples = sum(1 for _ in wiki_parser3.dict_yield_tuples(store, min_timestamp, max_timestamp))
+        results[cache_size] = time.perf_counter() - start
+        info = wiki_parser3.word_cache_info()
+        print(f'cache size {cache_size:<10} {results[cache_size]:8.2f} s {tuples} tuples {info.hits} hits {info.misses} misses')
+    print(f'Speedup: {results[0] / results[wiki_parser3.WORD_CACHE_SIZE]:.2f}x')
+
+def bench_normalize(data_file):
+    '''Checks convert_to_words_uncached gives the same words as convert_to_words_stripper on every added and removed string of a data file, then times both on all of them'''
+    strings = []
+    stores = [load_store(data_file)]
+    if not data_file.endswith('.json'):
+        # the pull engine unescapes entities, so its strings hold tags instead
+        stores.append(parse_file(data_file, 'bz2' if data_file.endswith('.bz2') else 'gz', engine='pull'))
+    for store in stores:
+        for title_dict in store.values():
+            for timestamp, edit in title_dict.items():
+                if timestamp != 'number of ts':
+                    strings.extend(edit['Removed'])
+                    strings.extend(edit['Added'])
+    corpus = sorted(set(strings))
+    different = [string for string in corpus if wiki_parser3.convert_to_words_uncached(string) != wiki_parser3.convert_to_words_stripper(string)]
+    for string in different[:10]:
+        print(f'different: {string!r}')
+    print(f'{len(corpus)} distinct strings, {len(different)} with different words')
+    tokens = sum(len(wiki_parser3.convert_to_words_uncached(string).split()) for string in strings)
+    results = {}
+    for name, function in (('stripper', wiki_parser3.convert_to_words_stripper), ('single pass', wiki_parser3.convert_to_words_uncached)):
+        results[name] = time_it(lambda: drain(map(function, strings)))
+        print(f'{name:<12} {results[name]:8.2f} s {tokens / results[name]:12.0f} tokens/s {len(strings) / results[name]:12.0f} strings/s')
+    print(f'Speedup: {results["stripper"] / results["single pass"]:.2f}x')
+    if different:
+        sys.exit(1)
+
+def bench_wikitext(data_file):
+    '''Parses a bz2 or gz dump into sorted tuples with and without wikitext cleaning, comparing their time and how many tokens they hold'''
+    file_type = 'bz2' if data_file.endswith('.bz2') else 'gz'
+    # every timestamp in range
+    min_timestamp, max_timestamp = 0, float('inf')
+    results = {}
+    for wikitext in (False, True):
+        start = time.perf_counter()
+        store = parse_file(data_file, file_type, wikitext=wikitext)
+        parsed = time.perf_counter()
+        tuples = sorted(wiki_parser3.dict_yield_tuples(store, min_timestamp, max_timestamp), key=lambda tup: tup[0])
+        finished = time.perf_counter()
+        strings = sum(len(edit['Removed']) + len(edit['Added']) for title_dict in store.values() for timestamp, edit in title_dict.items() if timestamp != 'number of ts')
+        tokens = sum(len(tup[1].split()) for tup in tuples)
+        results[wikitext] = (finished - start, strings, tokens)
+        name = 'cleaned' if wikitext else 'raw'
+        print(f'{name:<8} parse {parsed - start:8.2f} s tuples and sort {finished - parsed:8.2f} s {strings:10} added and removed {tokens:10} tuple words {len(tuples):8} tuples')
+    raw, cleaned = results[False], results[True]
+    print(f'Cleaning cuts tuple words by {1 - cleaned[2] / max(raw[2], 1):.1%} and added and removed strings by {1 - cleaned[1] / max(raw[1], 1):.1%}, end to end {raw[0] / cleaned[0]:.2f}x')
+
+def time_it(function):
+    '''Returns seconds taken by function()'''
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def bench_formats(data_file):
+    '''Times writing and reading back the parsed dictionary as json and as a binary page file'''
+    store = load_store(data_file)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_file = os.path.join(tmp_dir, 'store.json')
+        pages_file = os.path.join(tmp_dir, 'store.pages')
+
+        def write_json():
+            with open(json_file, 'w') as outfile:
+                json.dump(store, outfile)
+
+        def read_json():
+            with open(json_file, 'r') as read_file:
+                json.load(read_file)
+
+        def read_json_basic_parse():
+            with open(json_file, 'r') as read_file:
+                for event in ijson.basic_parse(read_file):
+                    pass
+
+        def read_json_kvitems():
+            with open(json_file, 'r') as read_file:
+                for title, title_dict in ijson.kvitems(read_file, '', use_float=True):
+                    pass
+
+        def read_pages_file():
+            for title, title_dict in read_pages(pages_file):
+                pass
+
+        print(f'{"json write":<24} {time_it(write_json):8.3f} s {os.path.getsize(json_file) / 1e6:10.2f} MB')
+        print(f'{"pages write":<24} {time_it(lambda: write_pages(store.items(), pages_file)):8.3f} s {os.path.getsize(pages_file) / 1e6:10.2f} MB')
+        print(f'{"json.load":<24} {time_it(read_json):8.3f} s')
+        print(f'{"ijson basic_parse":<24} {time_it(read_json_basic_parse):8.3f} s')
+        print(f'{"ijson kvitems":<24} {time_it(read_json_kvitems):8.3f} s')
+        print(f'{"pages read":<24} {time_it(read_pages_file):8.3f} s')
+
+        # reading straight into tuples, as the -t option does
+        def json_tuples():
+            with open(json_file, 'r') as read_file:
+                for tup in wiki_parser3.basic_parse_yield_tuples(ijson.basic_parse(read_file), 0, float('inf')):
+                    pass
+
+        def pages_tuples():
+            for tup in wiki_parser3.stream_yield_tuples(read_pages(pages_file), 0, float('inf')):
+                pass
+
+        print(f'{"json to tuples":<24} {time_it(json_tuples):8.3f} s')
+        print(f'{"pages to tuples":<24} {time_it(pages_tuples):8.3f} s')
+
+        # a single page from the middle of the file
+        titles = list(store)
+        title = titles[len(titles) // 2]
+        index = read_page_index(pages_file)
+        print(f'{"pages read one page":<24} {time_it(lambda: read_page(pages_file, title, index)) * 1e3:8.3f} ms')
+
+def bench_timestamps(count):
+    '''Times parse_timestamp against the dateutil parsing it replaced, and checks they agree in UTC'''
+    # strftime('%s') uses the local zone, so compare in UTC
+    os.environ['TZ'] = 'UTC'
+    time.tzset()
+    rand = random.Random(0)
+    timestamps = []
+    for _ in range(count):
+        seconds = rand.randrange(978307200, 1609459200) # 2001 to 2020
+        timestamps.append(time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds)))
+
+    start = time.perf_counter()
+    expected = [dp.parse(zulu).strftime('%s') for zulu in timestamps]
+    dateutil_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    parsed = [str(parse_timestamp(zulu)) for zulu in timestamps]
+    fast_secs = time.perf_counter() - start
+
+    mismatches = [zulu for zulu, a, b in zip(timestamps, expected, parsed) if a != b]
+    print(f'{"dateutil":<16} {dateutil_secs:8.3f} s {count / dateutil_secs:12.0f} timestamps/s')
+    print(f'{"parse_timestamp":<16} {fast_secs:8.3f} s {count / fast_secs:12.0f} timestamps/s')
+    print(f'Speedup: {dateutil_secs / fast_secs:.1f}x, {len(mismatches)} mismatches')
+    if mismatches:
+        print(f'First mismatch: {mismatches[0]}')
+        sys.exit(1)
+
+# Plain words and wikitext markup of synthetic dumps
+SYNTHETIC_WORDS = ['kota', 'desa', 'sungai', 'tahun', 'adalah', 'yang', 'dan', 'di', 'Indonesia', 'Jakarta',
+                   'penduduk', 'kabupaten', 'provinsi', 'pulau', 'bahasa', 'sejarah', 'wilayah', 'utara', 'selatan', 'barat']
+SYNTHETIC_MARKUP = ['[[Jakarta|ibu kota]]', '[[Kategori:Kota di Indonesia]]', '{{Infobox kota|nama=Contoh}}',
+                    '{{cite web|url=http://example.com|judul=Sumber}}', '&lt;ref&gt;Sumber&lt;/ref&gt;', "'''tebal'''",
+                    '{| class=&quot;wikitable&quot;', '[[Berkas:Peta.png|jmpl|Peta]]', '&amp;nbsp;', 'http%3A%2F%2Fexample.com']
+# mostly articles, like a real dump
+SYNTHETIC_NAMESPACES = [0, 0, 0, 0, 0, 0, 0, 1, 2, 4]
+
+def synthetic_dump_lines(pages, revisions, words, markup, seed=0):
+    '''
+    Yields the xml, in bytes, of a synthetic pages-meta-history dump, the same for the same arguments
+    pages : number of pages, revisions : revisions of every page, words : tokens in the text of a revision
+    markup : fraction of tokens that are wikitext markup instead of plain words
+    '''
+    rand = random.Random(seed)
+    # a few thousand plain words drawn with a long tail, like real text
+    plain = [f'{word}{i}' if i else word for i in range(250) for word in SYNTHETIC_WORDS]
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(plain) + 1)))
+
+    def token():
+        if rand.random() < markup:
+            return rand.choice(SYNTHETIC_MARKUP)
+        return rand.choices(plain, cum_weights=weights)[0]
+
+    yield b'<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" xml:lang="id">\n'
+    yield b'  <siteinfo>\n    <sitename>Wikipedia</sitename>\n  </siteinfo>\n'
+    revision_id = 0
+    for page_id in range(1, pages + 1):
+        title = f'Halaman {page_id}' if page_id % 10 else f'Halaman {page_id} &amp; lainnya'
+        yield f'  <page>\n    <title>{title}</title>\n    <ns>{rand.choice(SYNTHETIC_NAMESPACES)}</ns>\n    <id>{page_id}</id>\n'.encode()
+        text = [token() for _ in range(words)]
+        seconds = rand.randrange(978307200, 1420070400) # 2001 to 2015
+        for _ in range(revisions):
+            # a handful of words replaced, added or removed
+            for _ in range(rand.randint(1, 5)):
+                operation = rand.random()
+                position = rand.randrange(len(text) + 1)
+                if operation < 0.6 and position < len(text):
+                    text[position] = token()
+                elif operation < 0.8 or len(text) < 2:
+                    text.insert(position, token())
+                elif position < len(text):
+                    del text[position]
+            seconds += rand.randrange(3600, 30 * 86400)
+            revision_id += 1
+            timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+            lines = [f'    <revision>\n      <id>{revision_id}</id>\n      <timestamp>{timestamp}</timestamp>\n',
+                     f'      <contributor>\n        <username>Pengguna{rand.randrange(100)}</username>\n      </contributor>\n',
+                     '      <model>wikitext</model>\n      <format>text/x-wiki</format>\n']
+            if rand.random() < 0.01:
+                # blanked revision
+                lines.append('      <text bytes="0" />\n')
+            else:
+                text_lines = [' '.join(text[i:i + 12]) for i in range(0, len(text), 12)]
+                size = len(' '.join(text).encode())
+                text_lines[0] = f'      <text bytes="{size}" xml:space="preserve">' + text_lines[0]
+                text_lines[-1] += '</text>'
+                lines.append('\n'.join(text_lines) + '\n')
+            lines.append('      <sha1>0</sha1>\n    </revision>\n')
+            yield ''.join(lines).encode()
+        yield b'  </page>\n'
+    yield b'</mediawiki>\n'
+
+def generate_dump(base, pages, revisions, words, markup, seed=0):
+    '''Writes a synthetic dump as base-pages-meta-history.xml.bz2 and .xml.gz, returns the two file names'''
+    bz2_file = f'{base}-pages-meta-history.xml.bz2'
+    gz_file = f'{base}-pages-meta-history.xml.gz'
+    # no name or time in the gzip header, so the same arguments give the same file
+    with bz2.open(bz2_file, 'wb') as bz2_output, open(gz_file, 'wb') as raw_gz, \
+         gzip.GzipFile(filename='', fileobj=raw_gz, mode='wb', mtime=0) as gz_output:
+        for chunk in synthetic_dump_lines(pages, revisions, words, markup, seed):
+            bz2_output.write(chunk)
+            gz_output.write(chunk)
+    return bz2_file, gz_file
+
+def drain(iterable):
+    '''Consumes an iterable, returning how many items it had'''
+    count = 0
+    for _ in iterable:
+        count += 1
+    return count
+
+def older_dump_lines(lines, revisions):
+    '''Passes the chunks of synthetic_dump_lines through with only the first revisions of every page, as an earlier dump of the same wiki'''
+    kept = 0
+    for chunk in lines:
+        if chunk.startswith(b'  <page>'):
+            kept = 0
+        elif chunk.startswith(b'    <revision>'):
+            kept += 1
+            if kept > revisions:
+                continue
+        yield chunk
+
+def titled_outputs(tuples_file, titles_file):
+    '''
+    Returns the sorted tuples with titles in place of article numbers, and the counts of every title, to compare runs that number articles differently
+    Words of a tuple are sorted too, the set diff mode joins them in an order that changes with the hash seed of every process
+    '''
+    with open(titles_file, 'r') as read_file:
+        numbered_titles = json.load(read_file)
+    with open(tuples_file, 'rb') as read_file:
+        tuples = pickle.load(read_file)
+    titles = {int(index) : next(iter(entry)) for index, entry in numbered_titles.items()}
+    counts = {title : counts for entry in numbered_titles.values() for title, counts in entry.items()}
+    return sorted((months, titles[index], ' '.join(sorted(words.split()))) for months, words, index, topics in tuples), counts
+
+# the years of the incremental runs, later than the start of many synthetic pages so the new revisions of some give no tuples
+INCREMENTAL_YEARS = ('2001', '2008')
+
+def bench_incremental(pages, revisions, words):
+    '''Checks an -I run over an older dump then the newer one gives the same tuples and titles as one run over the newer dump, and times both'''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f'Generating {pages} pages of {revisions} revisions, {words} words, and an older dump of {revisions // 2} revisions of each')
+        new_file, _ = generate_dump(os.path.join(tmp_dir, 'new'), pages, revisions, words, 0.1)
+        old_file = os.path.join(tmp_dir, 'old-pages-meta-history.xml.bz2')
+        with bz2.open(old_file, 'wb') as output:
+            for chunk in older_dump_lines(synthetic_dump_lines(pages, revisions, words, 0.1), revisions // 2):
+                output.write(chunk)
+        state_file = os.path.join(tmp_dir, 'state')
+
+        def run(name, data_file, *arguments):
+            files = [os.path.join(tmp_dir, f'{name}.pkl'), os.path.join(tmp_dir, f'{name}.json')]
+            command = [sys.executable, os.path.join(SCRIPT_DIR, 'parse_wiki.py'), data_file, '-y', *INCREMENTAL_YEARS, '-t', files[0], '-d', files[1]] + list(arguments)
+            seconds = time_it(lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True))
+            return seconds, files
+
+        full_seconds, full_files = run('full', new_file)
+        old_seconds, _ = run('incremental', old_file, '-I', state_file)
+        new_seconds, incremental_files = run('incremental', new_file, '-I', state_file)
+        print(f'full run {full_seconds:8.2f} s, incremental runs {old_seconds:8.2f} s over the older dump and {new_seconds:8.2f} s over the newer one')
+        full_tuples, full_titles = titled_outputs(*full_files)
+        incremental_tuples, incremental_titles = titled_outputs(*incremental_files)
+    different = [title for title in full_titles.keys() | incremental_titles.keys() if full_titles.get(title) != incremental_titles.get(title)]
+    for title in sorted(different)[:10]:
+        print(f'different: {title} {full_titles.get(title)} {incremental_titles.get(title)}')
+    print(f'{len(full_tuples)} and {len(incremental_tuples)} tuples, {"the same" if full_tuples == incremental_tuples else "different"}')
+    print(f'{len(full_titles)} titles, {len(different)} with different counts')
+    if different or full_tuples != incremental_tuples:
+        sys.exit(1)
+
+def git_commit():
+    '''Commit of the scripts being measured, None outside of git'''
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+def bench_suite(results_file, pages, revisions, words, markup, repeats=3):
+    '''
+    Generates a synthetic dump, times every stage and the parse_wiki.py command line paths over it, and writes the results to results_file
+    Every time is the best of repeats runs
+    '''
+    config = {'pages' : pages, 'revisions' : revisions, 'words' : words, 'markup' : markup, 'repeats' : repeats}
+    seconds = {}
+
+    def record(name, function):
+        seconds[name] = round(min(time_it(function) for _ in range(repeats)), 4)
+        print(f'{name:<24} {seconds[name]:8.3f} s')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f'Generating {pages} pages of {revisions} revisions, {words} words, {markup:.0%} markup')
+        bz2_file, gz_file = generate_dump(os.path.join(tmp_dir, 'synthetic'), pages, revisions, words, markup)
+        json_file = os.path.join(tmp_dir, 'store.json')
+        tuples_file = os.path.join(tmp_dir, 'tuples.pkl')
+        titles_file = os.path.join(tmp_dir, 'titles.json')
+
+        # stages one at a time
+        counter = [0]
+        record('decompress bz2', lambda: drain(count_bytes(generate_lines(bz2_file), counter)))
+        record('decompress gz', lambda: drain(generate_lines(gz_file)))
+        for engine, parse in PARSE_ENGINES.items():
+            record(f'parse {engine} gz', lambda: drain(parse(generate_lines(gz_file))))
+        store = parse_file(gz_file, 'gz')
+        # every timestamp in range
+        min_timestamp, max_timestamp = 0, float('inf')
+
+        def make_tuples():
+            # cold cache every time
+            wiki_parser3.set_word_cache_size(wiki_parser3.WORD_CACHE_SIZE)
+            return drain(wiki_parser3.dict_yield_tuples(store, min_timestamp, max_timestamp))
+        record('tuples', make_tuples)
+        tuples = list(wiki_parser3.dict_yield_tuples(store, min_timestamp, max_timestamp))
+        record('sort', lambda: sorted(tuples, key=lambda tup: tup[0]))
+
+        def write_json():
+            with open(json_file, 'w') as outfile:
+                json.dump(store, outfile)
+
+        def write_tuples():
+            with open(tuples_file, 'wb') as outfile:
+                pickle.dump(tuples, outfile)
+        record('write json', write_json)
+        record('write tuples', write_tuples)
+
+        # whole command line paths
+        def cli(*arguments):
+            command = [sys.executable, os.path.join(SCRIPT_DIR, 'parse_wiki.py')] + list(arguments)
+            return lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        record('cli -f', cli(bz2_file, '-f', json_file))
+        record('cli -t', cli(bz2_file, '-t', tuples_file))
+        record('cli -d', cli(bz2_file, '-d', titles_file))
+        record('cli -s -f -t -d', cli(bz2_file, '-s', '-f', json_file, '-t', tuples_file, '-d', titles_file))
+        record('cli -w -f -t -d', cli(bz2_file, '-w', str(os.cpu_count() or 1), '-f', json_file, '-t', tuples_file, '-d', titles_file))
+        record('cli json -t -d', cli(json_file, '-t', tuples_file, '-d', titles_file))
+
+        sizes = {
+            'xml_bytes' : counter[0] // repeats,
+            'bz2_bytes' : os.path.getsize(bz2_file),
+            'gz_bytes' : os.path.getsize(gz_file),
+            'pages' : len(store),
+            'revisions' : sum(title_dict['number of ts'] for title_dict in store.values()),
+            'tuples' : len(tuples),
+        }
+
+    results = {
+        'config' : config,
+        'environment' : {
+            'date' : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit' : git_commit(),
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'cpus' : os.cpu_count(),
+        },
+        'sizes' : sizes,
+        'seconds' : seconds,
+    }
+    with open(results_file, 'w') as outfile:
+        json.dump(results, outfile, indent=1)
+    print(f'Results written to {results_file}')
+
+def bench_compare(old_file, new_file):
+    '''Prints the times of two suite results side by side'''
+    with open(old_file, 'r') as read_file:
+        old = json.load(read_file)
+    with open(new_file, 'r') as read_file:
+        new = json.load(read_file)
+    if old['config'] != new['config']:
+        print(f'Warning: results of different configs {old["config"]} and {new["config"]}')
+    print(f'{"":<24} {"old":>9} {"new":>9} {"speedup":>8}')
+    for name, new_seconds in new['seconds'].items():
+        old_seconds = old['seconds'].get(name)
+        if old_seconds is None:
+            print(f'{name:<24} {"":>9} {new_seconds:9.3f}')
+        else:
+            print(f'{name:<24} {old_seconds:9.3f} {new_seconds:9.3f} {old_seconds / max(new_seconds, 1e-9):7.2f}x')
+
+def main():
+    arguments = sys.argv[1:]
+    if len(arguments) == 0:
+        usage(1, 'No benchmark specified')
+    benchmark = arguments.pop(0)
+    if benchmark == '-h':
+        usage(0)
+    elif benchmark == 'engines':
+        if len(arguments) == 0:
+            usage(1, 'No data file')
+        bench_engines(arguments.pop(0))
+    elif benchmark == 'decompress':
+        if len(arguments) == 0:
+            usage(1, 'No data file')
+        bench_decompress(arguments.pop(0))
+    elif benchmark == 'diff':
+        revisions = int(arguments.pop(0)) if arguments else 10000
+        words = int(arguments.pop(0)) if arguments else 2000
+        bench_diff(revisions, words)
+    elif benchmark == 'words':
+        if len(arguments) == 0:
+            usage(1, 'No data file')
+        bench_words(arguments.pop(0))
+    elif benchmark == 'normalize':
+        if len(arguments) == 0:
+            usage(1, 'No data file')
+        bench_normalize(arguments.pop(0))
+    elif benchmark == 'wikitext':
+        if len(arguments) == 0:
+            usage(1, 'No data file')
+        bench_wikitext(arguments.pop(0))
+    elif benchmark == 'formats':
+        if len(arguments) == 0:
+            usage(1, 'No data file')
+        bench_formats(arguments.pop(0))
+    elif benchmark == 'timestamps':
+        bench_timestamps(int(arguments.pop(0)) if arguments else 200000)
+    elif benchmark == 'incremental':
+        pages = int(arguments.pop(0)) if arguments else 1000
+        revisions = int(arguments.pop(0)) if arguments else 20
+        words = int(arguments.pop(0)) if arguments else 500
+        bench_incremental(pages, revisions, words)
+    elif benchmark in ('generate', 'suite'):
+        if len(arguments) == 0:
+            usage(1, 'No output name' if benchmark == 'generate' else 'No results file')
+        output = arguments.pop(0)
+        pages = int(arguments.pop(0)) if arguments else 1000
+        revisions = int(arguments.pop(0)) if arguments else 20
+        words = int(arguments.pop(0)) if arguments else 500
+        markup = float(arguments.pop(0)) if arguments else 0.1
+        if benchmark == 'generate':
+            for file_name in generate_dump(output, pages, revisions, words, markup):
+                print(f'{file_name} {os.path.getsize(file_name) / 1e6:.2f} MB')
+        else:
+            bench_suite(output, pages, revisions, words, markup, int(arguments.pop(0)) if arguments else 3)
+    elif benchmark == 'compare':
+        if len(arguments) < 2:
+            usage(1, 'Two results files needed')
+        bench_compare(arguments.pop(0), arguments.pop(0))
+    else:
+        usage(3, 'Unknown benchmark')
+
+# Main Execution
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import json
+import heapq
+import numpy as np
+# include these scripts in same directory
+from tuple_sort import dump_run, read_run
+from vocabulary import Vocabulary
+
+# Seconds between checkpoints
+CHECKPOINT_SECONDS = 600
+# Progress of the run, replaced last so it only ever names shards that were fully written
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# A checkpoint directory holds
+#
+#     checkpoint.json   options of the run, position in the data file after the last page done, pages done,
+#                       size of the -f file so far and the names of the shards below
+#     tuples-N.pkl      tuples of the pages done since checkpoint N-1, sorted, as a run of tuple_sort
+#     titles-N.json     numbered titles added since checkpoint N-1
+#     columns-N.npz     column batches added since checkpoint N-1, with the lengths of their words
+#     vocabulary-N.tsv  whole vocabulary at checkpoint N, only the last one is kept
+#
+# The -f file is written in place and cut back to its checkpointed size when resuming.
+
+class Checkpointer:
+    '''
+    Saves the progress of a streaming parse into checkpoint_dir every interval seconds, so an interrupted run can resume
+    options : json-able dictionary of everything the outputs depend on, a checkpoint is only resumed with the same options
+    resume : load the checkpoint already in checkpoint_dir, it is then in state
+    '''
+    def __init__(self, checkpoint_dir, options, resume=False, interval=CHECKPOINT_SECONDS):
+        self.checkpoint_dir = checkpoint_dir
+        self.options = options
+        self.interval = interval
+        self.state = None # Checkpoint loaded to resume from
+        self.pages = 0 # Pages done, including those before the checkpoint
+        self.shards = {'tuples' : [], 'titles' : [], 'columns' : [], 'vocabulary' : []}
+        self.last_save = time.monotonic()
+
+        checkpoint_file = self.path(CHECKPOINT_FILE)
+        if not os.path.exists(checkpoint_file):
+            if resume:
+                print(f'No checkpoint in {checkpoint_dir}, starting from the beginning')
+            return
+        if not resume:
+            print(f'{checkpoint_dir} already holds a checkpoint, use --resume to carry on from it')
+            sys.exit(2)
+        with open(checkpoint_file, 'r') as read_file:
+            state = json.load(read_file)
+        if state['options'] != options:
+            print(f'Checkpoint in {checkpoint_dir} was made with other options, data file or outputs')
+            sys.exit(2)
+        self.state = state
+        self.pages = state['pages']
+        self.shards = state['shards']
+        print(f'Resuming after {self.pages} pages, {state["position"]["compressed"]} bytes into the data file')
+
+    def path(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    def track(self, pages, save):
+        '''
+        Pass pages as (title, title dictionary, position), yields (title, title dictionary)
+        Once a page has gone through every output, save(position) is called if a checkpoint is due
+        '''
+        for title, title_dict, position in pages:
+            yield title, title_dict
+            # the outputs asked for the next page, so this one is done
+            self.pages += 1
+            if time.monotonic() - self.last_save >= self.interval:
+                save(position)
+                self.last_save = time.monotonic()
+
+    def save(self, position, dict_size, tuples, titles, batches, vocabulary=None):
+        '''
+        Writes a checkpoint after the page at position
+        dict_size : bytes of the -f file written so far, or None
+        tuples : sorted tuples since the last checkpoint
+        titles : numbered titles added since the last checkpoint
+        batches : (times, indices, lengths, words) column batches added since the last checkpoint
+        vocabulary : optional Vocabulary the tuples are encoded with
+        '''
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        number = len(self.shards['tuples'])
+        self.add_shard('tuples', f'tuples-{number}.pkl', lambda output_file: dump_run(tuples, output_file))
+        self.add_shard('titles', f'titles-{number}.json', lambda output_file: output_file.write(json.dumps(titles).encode()))
+        self.add_shard('columns', f'columns-{number}.npz', lambda output_file: save_batches(batches, output_file))
+        old_vocabulary = self.shards['vocabulary']
+        if vocabulary is not None:
+            self.shards['vocabulary'] = []
+            self.add_shard('vocabulary', f'vocabulary-{number}.tsv', lambda output_file: output_file.write(''.join(vocabulary.lines()).encode()))
+
+        state = {
+            'options' : self.options,
+            'position' : position,
+            'pages' : self.pages,
+            'dict_size' : dict_size,
+            'shards' : self.shards,
+        }
+        temp_file = self.path(CHECKPOINT_FILE + '.tmp')
+        with open(temp_file, 'w') as output_file:
+            json.dump(state, output_file)
+            output_file.flush()
+            os.fsync(output_file.fileno())
+        os.replace(temp_file, self.path(CHECKPOINT_FILE))
+        if vocabulary is not None:
+            for name in old_vocabulary:
+                os.remove(self.path(name))
+        print(f'Checkpoint {number}: {self.pages} pages done, {position["compressed"]} bytes into the data file')
+
+    def add_shard(self, kind, name, write):
+        with open(self.path(name), 'wb') as output_file:
+            write(output_file)
+            output_file.flush()
+            os.fsync(output_file.fileno())
+        self.shards[kind].append(name)
+
+    def merge_tuples(self, tuples, key):
+        '''Yields the tuples of every shard and the sorted tuples given, merged in the same order as one stable sort'''
+        runs = [open(self.path(name), 'rb') for name in self.shards['tuples']]
+        try:
+            yield from heapq.merge(*[read_run(run) for run in runs], tuples, key=key)
+        finally:
+            for run in runs:
+                run.close()
+
+    def load_titles(self):
+        '''Returns the numbered titles of every shard'''
+        numbered_titles = {}
+        for name in self.shards['titles']:
+            with open(self.path(name), 'r') as read_file:
+                numbered_titles.update((int(index), entry) for index, entry in json.load(read_file).items())
+        return numbered_titles
+
+    def load_vocabulary(self):
+        '''Returns the vocabulary of the last checkpoint'''
+        vocabulary = Vocabulary()
+        for name in self.shards['vocabulary']:
+            vocabulary.load(self.path(name))
+        return vocabulary
+
+    def load_batches(self):
+        '''Returns the column batches of every shard'''
+        batches = []
+        for name in self.shards['columns']:
+            with np.load(self.path(name)) as shard:
+                if len(shard['lengths']):
+                    batches.append((shard['times'], shard['indices'], shard['lengths'], shard['words'].tobytes()))
+        return batches
+
+    def finish(self):
+        '''Removes the checkpoint and its shards once every output is written'''
+        if not os.path.isdir(self.checkpoint_dir):
+            return
+        names = [name for kind in self.shards.values() for name in kind]
+        for name in names + [CHECKPOINT_FILE]:
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+        if not os.listdir(self.checkpoint_dir):
+            os.rmdir(self.checkpoint_dir)
+
+def save_batches(batches, output_file):
+    '''Saves (times, indices, lengths, words) column batches as one batch'''
+    if batches:
+        times, indices, lengths, words = zip(*batches)
+        np.savez(output_file, times=np.concatenate(times), indices=np.concatenate(indices), lengths=np.concatenate(lengths),
+                 words=np.frombuffer(b''.join(words), dtype=np.uint8))
+    else:
+        np.savez(output_file, times=np.zeros(0, dtype=np.float64), indices=np.zeros(0, dtype=np.int32),
+                 lengths=np.zeros(0, dtype=np.int64), words=np.zeros(0, dtype=np.uint8))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import io
+import bz2
+import gzip
+import time
+import shutil
+import subprocess
+from contextlib import contextmanager
+# include these scripts in same directory
+import metrics
+
+# Decompressed bytes read at once before splitting them into lines
+CHUNK_SIZE = 1 << 20
+
+# External decompressors of every file type, parallel ones first, each reads stdin and writes to stdout
+DECOMPRESSORS = {
+    'bz2' : {'lbzip2' : ['lbzip2', '-d', '-c'], 'pbzip2' : ['pbzip2', '-d', '-c'], 'bzip2' : ['bzip2', '-d', '-c']},
+    'gz' : {'pigz' : ['pigz', '-d', '-c'], 'gzip' : ['gzip', '-d', '-c']},
+}
+# Decompressors auto picks when one is installed, the single threaded tools only help with a core to spare
+PARALLEL_DECOMPRESSORS = ('lbzip2', 'pbzip2', 'pigz')
+STDLIB_OPENERS = {'bz2' : bz2.open, 'gz' : gzip.open}
+
+# auto, stdlib, or the name of one of the DECOMPRESSORS
+BACKEND = 'auto'
+
+def backend_names():
+    return ['auto', 'stdlib'] + [name for commands in DECOMPRESSORS.values() for name in commands]
+
+def set_backend(name):
+    '''Chooses how bz2 and gz files are decompressed from now on'''
+    global BACKEND
+    if name not in backend_names():
+        raise ValueError(f'Decompressor must be one of {", ".join(backend_names())}')
+    BACKEND = name
+
+def find_decompressor(file_type, backend=None):
+    '''Returns the command line of the external decompressor to use for file_type, or None for the stdlib'''
+    backend = BACKEND if backend is None else backend
+    commands = DECOMPRESSORS[file_type]
+    if backend == 'auto':
+        for name in PARALLEL_DECOMPRESSORS:
+            if name in commands and shutil.which(name):
+                return commands[name]
+        return None
+    if backend == 'stdlib' or backend not in commands:
+        # a decompressor of the other file type
+        return None
+    if not shutil.which(backend):
+        raise OSError(f'Decompressor {backend} is not installed')
+    return commands[backend]
+
+@contextmanager
+def open_decompressed(data_file, file_type, backend=None):
+    '''
+    Yields (raw, read_file), the open data file and a binary file of its decompressed bytes
+    raw.tell() is how far into the data file decompression has got, with either backend
+    '''
+    command = find_decompressor(file_type, backend)
+    with open(data_file, 'rb') as raw:
+        if command is None:
+            with STDLIB_OPENERS[file_type](raw, 'rb') as read_file:
+                yield raw, read_file
+            return
+        # the decompressor reads the same open file, so raw.tell() follows it
+        process = subprocess.Popen(command, stdin=raw, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        finished = False
+        try:
+            yield raw, process.stdout
+            finished = True
+        finally:
+            if finished:
+                process.stdout.close()
+                error = process.stderr.read().decode(errors='replace').strip()
+                if process.wait() != 0:
+                    raise OSError(f'{command[0]} failed on {data_file}: {error}')
+            else:
+                # stopped early, the rest of the file is not wanted
+                process.kill()
+                process.stdout.close()
+                process.wait()
+            process.stderr.close()
+
+def chunk_lines(read_file, raw_file=None, chunk_size=CHUNK_SIZE):
+    '''
+    Yields the lines of a binary file, the same as iterating over it, reading chunk_size bytes at a time
+    With metrics on, adds the time waiting on read_file and the bytes read from it and from raw_file to metrics.METRICS
+    '''
+    recorder = metrics.METRICS
+    rest = b''
+    while True:
+        if recorder is None:
+            chunk = read_file.read(chunk_size)
+        else:
+            start = time.perf_counter()
+            chunk = read_file.read(chunk_size)
+            recorder.add_time('decompress', time.perf_counter() - start)
+            if raw_file is not None:
+                recorder.counters['compressed_bytes'] = raw_file.tell()
+            recorder.count('decompressed_bytes', len(chunk))
+        if not chunk:
+            break
+        data = rest + chunk if rest else chunk
+        end = data.rfind(b'\n') + 1
+        rest = data[end:]
+        # BytesIO splits on newlines only, the same as iterating over the file
+        yield from io.BytesIO(data[:end])
+    if rest:
+        yield rest
+
+def generate_lines(data_file, file_type, backend=None, chunk_size=CHUNK_SIZE):
+    '''Yields the lines of a bz2 or gz data file'''
+    with open_decompressed(data_file, file_type, backend) as (raw, read_file):
+        yield from chunk_lines(read_file, raw, chunk_size)
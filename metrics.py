@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import json
+import resource
+from contextlib import contextmanager
+
+# Seconds between progress records
+METRICS_SECONDS = 10
+COUNTERS = ('compressed_bytes', 'decompressed_bytes', 'pages', 'revisions', 'tuples')
+STAGES = ('decompress', 'parse', 'diff', 'normalize', 'sort', 'write')
+
+# Metrics of the current run, None when they are off
+METRICS = None
+
+class Metrics:
+    '''
+    Counters and stage times of a run, written to output as json lines
+    A 'progress' record is written every interval seconds, with rates since the previous record, and a 'summary' one at the end
+    '''
+    def __init__(self, output, interval=METRICS_SECONDS):
+        self.output = output
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_time = self.start
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.last_counters = dict(self.counters)
+        # measured seconds, stages are worked out from them
+        # pages is time parsing a whole file at once, pages_in waiting on a streaming parser, pages_out on it and the -f writer
+        self.times = dict.fromkeys(('decompress', 'diff', 'normalize', 'sort', 'write', 'pages', 'pages_in', 'pages_out'), 0.0)
+        # json-able sections other parts of the run add to every record, such as the stats of a pipeline
+        self.sections = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def add_time(self, name, seconds):
+        self.times[name] += seconds
+
+    def stages(self):
+        '''Seconds spent in every stage so far'''
+        times = self.times
+        # the parser's time holds decompression and diffs
+        parse = max(times['pages'] + times['pages_in'] - times['decompress'] - times['diff'], 0.0)
+        write = times['write'] + max(times['pages_out'] - times['pages_in'], 0.0)
+        stages = {'decompress' : times['decompress'], 'parse' : parse, 'diff' : times['diff'],
+                  'normalize' : times['normalize'], 'sort' : times['sort'], 'write' : write}
+        return {stage : round(stages[stage], 3) for stage in STAGES}
+
+    def rates(self, counters, seconds):
+        seconds = max(seconds, 1e-9)
+        return {
+            'compressed_mb_per_sec' : round(counters['compressed_bytes'] / 1e6 / seconds, 3),
+            'decompressed_mb_per_sec' : round(counters['decompressed_bytes'] / 1e6 / seconds, 3),
+            'pages_per_sec' : round(counters['pages'] / seconds, 1),
+            'revisions_per_sec' : round(counters['revisions'] / seconds, 1),
+            'tuples_per_sec' : round(counters['tuples'] / seconds, 1),
+        }
+
+    def record(self, kind):
+        '''Returns the record of the run so far, with rates since the last record for progress and since the start for the summary'''
+        now = time.perf_counter()
+        if kind == 'summary':
+            rates = self.rates(self.counters, now - self.start)
+        else:
+            since = {name : self.counters[name] - self.last_counters[name] for name in COUNTERS}
+            rates = self.rates(since, now - self.last_time)
+        self.last_time = now
+        self.last_counters = dict(self.counters)
+        record = {'kind' : kind, 'time' : round(time.time(), 3), 'elapsed' : round(now - self.start, 3)}
+        record.update(self.counters)
+        record.update(rates)
+        record['rss_mb'] = round(rss_bytes() / 1e6, 1)
+        record['max_rss_mb'] = round(max_rss_bytes() / 1e6, 1)
+        record['stages'] = self.stages()
+        record.update(self.sections)
+        return record
+
+    def emit(self, kind):
+        self.output.write(json.dumps(self.record(kind)) + '\n')
+        self.output.flush()
+
+    def tick(self):
+        '''Writes a progress record if one is due'''
+        if time.perf_counter() - self.last_time >= self.interval:
+            self.emit('progress')
+
+    def timed(self, iterable, name):
+        '''Passes items through, adding the time spent getting each one to name'''
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.times[name] += time.perf_counter() - start
+                return
+            self.times[name] += time.perf_counter() - start
+            yield item
+
+    def meter_pages(self, pages):
+        '''Passes (title, title dictionary) through, timing the parser and counting pages and revisions'''
+        for title, title_dict in self.timed(pages, 'pages_in'):
+            self.counters['pages'] += 1
+            self.counters['revisions'] += title_dict.get('number of ts', 0)
+            yield title, title_dict
+            self.tick()
+
+    def meter_tuples(self, tuples):
+        for tup in tuples:
+            self.counters['tuples'] += 1
+            yield tup
+
+def rss_bytes():
+    '''Resident memory of this process, the peak where the current one is not available'''
+    try:
+        with open('/proc/self/statm', 'r') as read_file:
+            return int(read_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return max_rss_bytes()
+
+def max_rss_bytes():
+    # kilobytes on linux, bytes on macos
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def start_metrics(file_name, interval=METRICS_SECONDS):
+    '''Turns metrics on, written to file_name or to stdout for -'''
+    global METRICS
+    output = sys.stdout if file_name == '-' else open(file_name, 'w')
+    METRICS = Metrics(output, interval)
+    return METRICS
+
+def finish_metrics():
+    '''Writes the summary record and turns metrics off'''
+    global METRICS
+    if METRICS is None:
+        return
+    METRICS.emit('summary')
+    if METRICS.output is not sys.stdout:
+        METRICS.output.close()
+    METRICS = None
+
+def timed_function(function, name):
+    '''Returns function, adding the time of every call to name if metrics are on'''
+    if METRICS is None:
+        return function
+    metrics = METRICS
+
+    def timed_call(*args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            metrics.times[name] += time.perf_counter() - start
+    return timed_call
+
+@contextmanager
+def stage(name):
+    '''Adds the time of the with block to name if metrics are on'''
+    if METRICS is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.times[name] += time.perf_counter() - start
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import struct
+import numpy as np
+
+# Page state file, where an incremental run (-I) left every page, so the next run of a newer dump only adds new edits
+#
+#     MAGIC
+#     page records, each a uint32 length followed by
+#         uint64 page ID, uint64 last revision ID, int64 epoch seconds of the last revision,
+#         uint32 title length, title, words of the last revision
+#     uint32 0, end of records
+#     index: uint64 number of pages, uint64 page IDs sorted, uint64 offset of every record
+#     uint32 options length, json options of the runs
+#     uint64 offset of the index, MAGIC
+#
+# Words are what the diff mode kept of the last revision as text, see xml_parse.words_text.
+# All numbers are little-endian and strings are utf-8.
+
+MAGIC = b'WIKISTA1'
+RECORD = struct.Struct('<QQqI')
+
+class PageStates:
+    '''
+    Reads a page state file, looking pages up by page ID
+    A file that does not exist yet has no pages
+    '''
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.read_file = None
+        self.page_ids = np.zeros(0, dtype='<u8')
+        self.offsets = np.zeros(0, dtype='<u8')
+        self.options = None
+        if not os.path.exists(file_name):
+            return
+        self.read_file = open(file_name, 'rb')
+        if self.read_file.read(len(MAGIC)) != MAGIC:
+            print(f'{file_name} is not a page state file')
+            sys.exit(1)
+        self.read_file.seek(-8 - len(MAGIC), os.SEEK_END)
+        index_offset = struct.unpack('<Q', self.read_file.read(8))[0]
+        self.read_file.seek(index_offset)
+        count = struct.unpack('<Q', self.read_file.read(8))[0]
+        self.page_ids = np.frombuffer(self.read_file.read(8 * count), dtype='<u8')
+        self.offsets = np.frombuffer(self.read_file.read(8 * count), dtype='<u8')
+        options_length = struct.unpack('<I', self.read_file.read(4))[0]
+        self.options = json.loads(self.read_file.read(options_length))
+
+    def __len__(self):
+        return len(self.page_ids)
+
+    def position(self, page_id):
+        '''Position of page_id in the index, or None'''
+        position = int(np.searchsorted(self.page_ids, page_id))
+        if position < len(self.page_ids) and self.page_ids[position] == page_id:
+            return position
+        return None
+
+    def record(self, position):
+        '''Bytes of the record at position in the index'''
+        self.read_file.seek(int(self.offsets[position]))
+        length = struct.unpack('<I', self.read_file.read(4))[0]
+        return self.read_file.read(length)
+
+    def get(self, page_id):
+        '''Returns (last revision ID, epoch seconds, words) of page_id, or None for a page not seen before'''
+        position = self.position(page_id)
+        if position is None:
+            return None
+        title, revision_id, seconds, words = decode_state(self.record(position))
+        return revision_id, seconds, words
+
+    def close(self):
+        if self.read_file is not None:
+            self.read_file.close()
+
+def encode_state(page_id, revision_id, seconds, title, words):
+    encoded_title = title.encode()
+    return RECORD.pack(page_id, revision_id, seconds, len(encoded_title)) + encoded_title + words.encode()
+
+def decode_state(record):
+    '''Returns (title, last revision ID, epoch seconds, words) of a record'''
+    page_id, revision_id, seconds, title_length = RECORD.unpack_from(record)
+    title_end = RECORD.size + title_length
+    return record[RECORD.size:title_end].decode(), revision_id, seconds, record[title_end:].decode()
+
+class PageStateWriter:
+    '''
+    Writes the page state file of an incremental run, taking over the state of the last run in file_name
+    options : json-able dictionary of everything the tuples depend on, the state is only carried on with the same options
+    Pages are passed through track, the file is replaced by close
+    '''
+    def __init__(self, file_name, options):
+        self.file_name = file_name
+        self.options = options
+        self.old = PageStates(file_name)
+        if self.old.options is not None and self.old.options != options:
+            print(f'Page state in {file_name} was made with other years, parser engine, diff mode or wikitext cleaning')
+            sys.exit(2)
+        self.output_file = open(file_name + '.tmp', 'wb')
+        self.output_file.write(MAGIC)
+        self.page_ids = []
+        self.offsets = []
+
+    def track(self, pages):
+        '''Pass pages as (title, title dictionary) with the 'page id' and 'state' the parser gave them, yields them without the state'''
+        for title, title_dict in pages:
+            page_id = title_dict['page id']
+            revision_id, seconds, words = title_dict.pop('state')
+            self.page_ids.append(page_id)
+            self.offsets.append(self.output_file.tell())
+            record = encode_state(page_id, revision_id, seconds, title, words)
+            self.output_file.write(struct.pack('<I', len(record)))
+            self.output_file.write(record)
+            yield title, title_dict
+
+    def close(self):
+        '''Carries over the state of pages not in this run and replaces the state file'''
+        page_ids = np.array(self.page_ids, dtype='<u8')
+        offsets = np.array(self.offsets, dtype='<u8')
+        kept = np.flatnonzero(~np.isin(self.old.page_ids, page_ids))
+        kept_offsets = []
+        for position in kept:
+            kept_offsets.append(self.output_file.tell())
+            record = self.old.record(position)
+            self.output_file.write(struct.pack('<I', len(record)))
+            self.output_file.write(record)
+        page_ids = np.concatenate([page_ids, self.old.page_ids[kept]])
+        offsets = np.concatenate([offsets, np.array(kept_offsets, dtype='<u8')])
+        order = np.argsort(page_ids, kind='stable')
+
+        self.output_file.write(struct.pack('<I', 0))
+        index_offset = self.output_file.tell()
+        self.output_file.write(struct.pack('<Q', len(order)))
+        for column in (page_ids, offsets):
+            self.output_file.write(column[order].tobytes())
+        encoded_options = json.dumps(self.options).encode()
+        self.output_file.write(struct.pack('<I', len(encoded_options)))
+        self.output_file.write(encoded_options)
+        self.output_file.write(struct.pack('<Q', index_offset))
+        self.output_file.write(MAGIC)
+        self.output_file.flush()
+        os.fsync(self.output_file.fileno())
+        self.output_file.close()
+        self.old.close()
+        os.replace(self.file_name + '.tmp', self.file_name)
+        print(f'Saved the state of {len(order)} pages to {self.file_name}, {len(self.page_ids)} of them from this run')
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+import sys
+import gc
+import struct
+from array import array
+from itertools import accumulate
+
+# Binary page file, an alternative to the -f json dictionary
+#
+#     MAGIC
+#     blocks of pages, each a uint32 length followed by that many bytes
+#     uint32 0, end of blocks
+#     index: uint64 number of pages, then for every page uint64 offset of its block, uint32 number of the page in
+#            its block, uint32 title length, title
+#     uint64 offset of the index, MAGIC
+#
+# Pages are written in blocks of up to BLOCK_PAGES pages or BLOCK_BYTES bytes that share one string table, so a
+# word is stored once in every block instead of once in every page, and the table is read back with one split:
+#
+#     uint32 number of strings, uint32 length of every string, the strings each followed by a 0 byte
+#     uint32 number of pages, page records, each a uint32 length followed by
+#         uint32 title length, title, uint32 number of ts
+#         uint32 number of timestamps, int64 timestamps, uint32 removed counts, uint32 added counts
+#         uint32 string number of every removed then added word, timestamp by timestamp
+#
+# A block does not depend on the rest of the file, so pages stream in and out a block at a time.
+# All numbers are little-endian and strings are utf-8.
+
+MAGIC = b'WIKIPGS2'
+PAGES_EXTENSION = '.pages'
+BLOCK_PAGES = 1000
+BLOCK_BYTES = 4 * 1024 * 1024
+
+def to_little_endian(values):
+    '''Returns the bytes of an array, little-endian'''
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def from_little_endian(typecode, data):
+    '''Returns an array from little-endian bytes'''
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+def encode_page(title, title_dict, strings):
+    '''Returns the record bytes of one title dictionary, adding its words to strings, the word -> string number table of its block'''
+    timestamps = array('q')
+    removed_counts = array('I')
+    added_counts = array('I')
+    words = array('I')
+    for timestamp in title_dict:
+        # skip number of ts entry
+        if timestamp == 'number of ts':
+            continue
+        edit = title_dict[timestamp]
+        timestamps.append(int(timestamp))
+        removed_counts.append(len(edit['Removed']))
+        added_counts.append(len(edit['Added']))
+        for word in edit['Removed']:
+            words.append(strings.setdefault(word, len(strings)))
+        for word in edit['Added']:
+            words.append(strings.setdefault(word, len(strings)))
+
+    encoded_title = title.encode()
+    return b''.join([
+        struct.pack('<I', len(encoded_title)), encoded_title,
+        struct.pack('<I', title_dict.get('number of ts', 0)),
+        struct.pack('<I', len(timestamps)),
+        to_little_endian(timestamps),
+        to_little_endian(removed_counts),
+        to_little_endian(added_counts),
+        to_little_endian(words),
+    ])
+
+def encode_strings(strings):
+    '''Returns the string table bytes of a block, strings in order of their numbers'''
+    encoded_strings = [string.encode() for string in strings]
+    return b''.join([
+        struct.pack('<I', len(encoded_strings)),
+        to_little_endian(array('I', map(len, encoded_strings))),
+        b''.join(string + b'\0' for string in encoded_strings),
+    ])
+
+def decode_strings(view):
+    '''Returns (list of strings, bytes taken) of the string table at the start of a block'''
+    num_strings = struct.unpack_from('<I', view)[0]
+    lengths = from_little_endian('I', view[4:4 + 4 * num_strings])
+    end = 4 + 4 * num_strings + sum(lengths) + num_strings
+    data = bytes(view[4 + 4 * num_strings:end])
+    # a 0 byte is never part of a longer utf-8 character, the whole table decodes at once
+    strings = data.decode().split('\0')[:-1]
+    if len(strings) != num_strings:
+        # some string holds a 0 character itself, cut them by their lengths instead
+        ends = list(accumulate(length + 1 for length in lengths))
+        strings = [data[end - length - 1:end - 1].decode() for end, length in zip(ends, lengths)]
+    return strings, end
+
+def decode_page(record, strings):
+    '''Returns (title, title dictionary) of a record, in the same format as the json dictionary, strings is the table of its block'''
+    view = memoryview(record)
+    position = 0
+
+    def take(size):
+        nonlocal position
+        position += size
+        return view[position - size:position]
+
+    def take_uint():
+        return struct.unpack('<I', take(4))[0]
+
+    title = bytes(take(take_uint())).decode()
+    title_dict = {'number of ts' : take_uint()}
+
+    num_timestamps = take_uint()
+    timestamps = from_little_endian('q', take(8 * num_timestamps))
+    removed_counts = from_little_endian('I', take(4 * num_timestamps))
+    added_counts = from_little_endian('I', take(4 * num_timestamps))
+    words = list(map(strings.__getitem__, from_little_endian('I', view[position:])))
+
+    start = 0
+    for timestamp, num_removed, num_added in zip(timestamps, removed_counts, added_counts):
+        edit = {}
+        edit['Removed'] = words[start:start + num_removed]
+        start += num_removed
+        edit['Added'] = words[start:start + num_added]
+        start += num_added
+        title_dict[str(timestamp)] = edit
+    return title, title_dict
+
+def block_records(block):
+    '''Returns (list of strings, list of page records) of a block'''
+    view = memoryview(block)
+    strings, position = decode_strings(view)
+    num_pages = struct.unpack_from('<I', view, position)[0]
+    position += 4
+    records = []
+    for _ in range(num_pages):
+        length = struct.unpack_from('<I', view, position)[0]
+        records.append(view[position + 4:position + 4 + length])
+        position += 4 + length
+    return strings, records
+
+def decode_block(block):
+    '''Returns the list of (title, title dictionary) of every page in a block'''
+    strings, records = block_records(block)
+    # pages hold no reference cycles, collections while building them would only walk every object already alive
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [decode_page(record, strings) for record in records]
+    finally:
+        if enabled:
+            gc.enable()
+
+def record_title(record):
+    '''Title of a page record, without decoding the rest'''
+    title_length = struct.unpack_from('<I', record)[0]
+    return bytes(record[4:4 + title_length]).decode()
+
+class PageWriter:
+    '''Writes (title, title dictionary) pages into a binary page file a block at a time, use as a context manager'''
+    def __init__(self, file_name, resume_size=None):
+        '''resume_size : bytes of an unfinished page file to keep, as told by tell after a flush, new pages are written after the ones in them'''
+        if resume_size is None:
+            self.output_file = open(file_name, 'wb')
+            self.output_file.write(MAGIC)
+            self.index = [] # (block offset, number in block, title) of every page
+        else:
+            self.output_file = open(file_name, 'r+b')
+            check_magic(self.output_file)
+            self.index = scan_blocks(self.output_file, resume_size)
+            self.output_file.truncate(resume_size)
+            self.output_file.seek(resume_size)
+        self.strings = {} # Word -> string number of the block being built
+        self.records = [] # Page records of the block being built
+        self.block_bytes = 0
+
+    def write_page(self, title, title_dict):
+        record = encode_page(title, title_dict, self.strings)
+        # the block goes where the file ends now
+        self.index.append((self.output_file.tell(), len(self.records), title))
+        self.records.append(record)
+        self.block_bytes += len(record)
+        if len(self.records) >= BLOCK_PAGES or self.block_bytes >= BLOCK_BYTES:
+            self.write_block()
+
+    def write_block(self):
+        '''Writes the pages given since the last block as one block'''
+        if not self.records:
+            return
+        parts = [encode_strings(self.strings), struct.pack('<I', len(self.records))]
+        for record in self.records:
+            parts.append(struct.pack('<I', len(record)))
+            parts.append(record)
+        block = b''.join(parts)
+        self.output_file.write(struct.pack('<I', len(block)))
+        self.output_file.write(block)
+        self.strings = {}
+        self.records = []
+        self.block_bytes = 0
+
+    def yield_pages(self, pages):
+        '''Passes (title, title dictionary) pages through, writing each one'''
+        for title, title_dict in pages:
+            self.write_page(title, title_dict)
+            yield title, title_dict
+
+    def flush(self):
+        '''Writes the pages given so far, ending the block being built'''
+        self.write_block()
+        self.output_file.flush()
+
+    def tell(self):
+        '''Size of the file with the blocks written so far, every page given once flushed'''
+        return self.output_file.tell()
+
+    def close(self):
+        self.write_block()
+        # end of blocks, then the index
+        self.output_file.write(struct.pack('<I', 0))
+        index_offset = self.output_file.tell()
+        self.output_file.write(struct.pack('<Q', len(self.index)))
+        for offset, number, title in self.index:
+            encoded_title = title.encode()
+            self.output_file.write(struct.pack('<QII', offset, number, len(encoded_title)))
+            self.output_file.write(encoded_title)
+        self.output_file.write(struct.pack('<Q', index_offset))
+        self.output_file.write(MAGIC)
+        self.output_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def write_pages(pages, file_name):
+    '''Writes an iterable of (title, title dictionary) into file_name'''
+    with PageWriter(file_name) as writer:
+        for title, title_dict in pages:
+            writer.write_page(title, title_dict)
+
+def check_magic(read_file):
+    if read_file.read(len(MAGIC)) != MAGIC:
+        print(f'{read_file.name} is not a binary page file')
+        sys.exit(1)
+
+def read_blocks(read_file, end=None):
+    '''Yields (offset, bytes) of every block from the current position of read_file, up to end or the end of blocks'''
+    offset = read_file.tell()
+    while end is None or offset < end:
+        length = struct.unpack('<I', read_file.read(4))[0]
+        if length == 0:
+            return
+        yield offset, read_file.read(length)
+        offset += 4 + length
+
+def scan_blocks(read_file, end):
+    '''Returns (block offset, number in block, title) of every page from the current position of read_file up to end'''
+    index = []
+    for offset, block in read_blocks(read_file, end):
+        strings, records = block_records(block)
+        index.extend((offset, number, record_title(record)) for number, record in enumerate(records))
+    return index
+
+def read_pages(file_name):
+    '''Yields (title, title dictionary) of every page in file order, one block at a time'''
+    with open(file_name, 'rb') as read_file:
+        check_magic(read_file)
+        for offset, block in read_blocks(read_file):
+            yield from decode_block(block)
+
+def read_page_index(file_name):
+    '''Returns dictionary of title -> (offset of its block, number in the block)'''
+    with open(file_name, 'rb') as read_file:
+        check_magic(read_file)
+        read_file.seek(-8 - len(MAGIC), 2)
+        index_offset = struct.unpack('<Q', read_file.read(8))[0]
+        if read_file.read(len(MAGIC)) != MAGIC:
+            print(f'{file_name} has no page index')
+            sys.exit(1)
+        read_file.seek(index_offset)
+        data = read_file.read()
+
+    index = {}
+    position = 8
+    for _ in range(struct.unpack_from('<Q', data)[0]):
+        offset, number, title_length = struct.unpack_from('<QII', data, position)
+        position += 16
+        index[data[position:position + title_length].decode()] = (offset, number)
+        position += title_length
+    return index
+
+def read_page(file_name, title, index=None):
+    '''Returns the title dictionary of a single title, or None if it is not in the file'''
+    if index is None:
+        index = read_page_index(file_name)
+    if title not in index:
+        return None
+    offset, number = index[title]
+    with open(file_name, 'rb') as read_file:
+        read_file.seek(offset)
+        length = struct.unpack('<I', read_file.read(4))[0]
+        strings, records = block_records(read_file.read(length))
+    return decode_page(records[number], strings)[1]
@@ -3,13 +3,25 @@
 import sys
 import os
 import datetime as dt
-import string
 import pickle
 import json
+import heapq
 import ijson
 # include these scripts in same directory
-from wiki_parser3 import dict_yield_tuples, dict_make_numbered_titles_file, basic_parse_yield_tuples, basic_parse_make_numbered_titles_file
-from xml_parse import parse_file
+from wiki_parser3 import stream_yield_tuples, set_word_cache_size, word_cache_info
+from xml_parse import parse_file, parse_pages, parse_positioned_pages, open_page_states, PARSE_ENGINES, DIFF_MODES, PageFilter, load_titles
+from tuple_sort import external_sort, save_list_stream
+from page_store import PageWriter, read_pages, PAGES_EXTENSION
+from tuple_arrays import TupleColumnsBuilder, sort_tuple_columns, save_tuple_columns
+from checkpoint import Checkpointer, CHECKPOINT_SECONDS
+from tuple_shards import ShardWriter, MONTHS_PER_SHARD, ARTICLES_PER_SHARD
+from tuple_store import save_tuple_store, STORE_EXTENSION
+from vocabulary import open_vocabulary
+from page_state import PageStateWriter
+from article_index import ArticleIndex, ARTICLE_INDEX_EXTENSION
+from pipeline import PagePipeline
+import metrics
+import decompress
 
 
 def usage(status=0, error_message=''):
@@ -19,16 +31,40 @@ def usage(status=0, error_message=''):
 
     [DATA_FILE]             Data file to parse. Must be one of the following extensions:
 
-        1. bz2 :    Must be in format idwiki-date-pages-meta-history.xml.bz2 from wikimedia.
+        1. bz2 :    Must be in format idwiki-date-pages-meta-history.xml.bz2 or idwiki-date-pages-articles-multistream.xml.bz2 from wikimedia.
         2. gz :     Must be in format idwiki-date-pages-meta-history.xml.gz from wikimedia.
         3. json :   Pre-parsed file that is created using the -f flag from this program. Must be in this format.
+        4. pages :  Pre-parsed binary page file that is created using the -f flag from this program.
 
     OPTIONS:
     -h                          Display usage                            
-    -f [FILE_NAME]              Save parsed data from bz2 or gz file into json dictionary file. Must have .json extension.
+    -f [FILE_NAME]              Save parsed data from bz2 or gz file into json dictionary file, or into a compact binary page file. Must have .json or .pages extension.
     -t [FILE_NAME]              Save parsed tuples in format for hdhp inference to pickle file specified.
     -d [FILE_NAME]              Save dictionary of numbers associated with collected titles into file.
+    -a [FILE_NAME]              Save tuples as sorted columnar numpy arrays (times, indices, offsets, words) into npz file specified, or into a read-only tuple store that is memory-mapped to read time windows if it has the .tuples extension.
+    -S [SHARD_DIR]              Save tuples partitioned by month and by article number into pickle shards, titles by article number, and a manifest.json of counts and bounds of every shard.
+    -P [MONTHS] [ARTICLES]      Months and articles per shard with -S. Default is 1 month and 10000 articles.
+    -L [METRICS_FILE]           Write json lines of throughput, memory and time per stage into METRICS_FILE, or to stdout for -. A progress record every 10 seconds and a summary at the end.
+    -V [VOCAB_FILE]             Give every word a stable integer ID, saving the words of -a npz columns as a tokens column of IDs and the vocabulary with frequencies into VOCAB_FILE. Needs -a with an npz file, -t and -S tuples keep their words. IDs of an existing VOCAB_FILE are kept.
     -y [MIN_YEAR] [MAX_YEAR]    Specify the years to collect timestamps. Will go to end of max year. Default is 2000 to end of 2020.
+    -s                          Stream articles from bz2 or gz file straight into the outputs, without loading the whole dictionary into memory.
+    -m [INDEX_FILE]             Multistream index for a multistream bz2 file. Streams are decompressed and parsed in parallel.
+    -p [PROCESSES]              Number of processes to use with -m. Default is the number of cores.
+    -e [ENGINE]                 XML parser for bz2 or gz file. lines (default) scans tags line by line, pull uses an incremental XML parser and unescapes entities.
+    -D [DIFF_MODE]              How Added and Removed words of a revision are found from bz2 or gz file. set (default) keeps every word added or removed once, counts keeps a word as many times as its count went up or down, spans keeps every run of words inserted or deleted in place as one string, found by a patience diff.
+    -W                          Clean wikitext out of every revision from bz2 or gz file before diffing: templates, tables, refs, comments, file and category links are dropped, and links keep only their display text.
+    -z [DECOMPRESSOR]           How bz2 or gz files are decompressed. auto (default) pipes them through lbzip2, pbzip2 or pigz when one is installed, and otherwise uses the python bz2 and gzip modules, as stdlib always does. lbzip2, pbzip2, bzip2, pigz or gzip use that command.
+    -c [CACHE_SIZE]             Number of strings to remember when converting them to words. 0 turns the cache off. Default is 1048576.
+    -M [MEGABYTES]              Sort tuples on disk, keeping about MEGABYTES of tuples in memory and merging sorted runs from temporary files.
+    -n [NAMESPACES]             Only parse pages in these namespaces, separated by commas, such as 0 for articles.
+    -l [TITLES_FILE]            Only parse pages whose title is in this file, one title per line.
+    -r [REGEX]                  Only parse pages whose title matches this regular expression. With -m, -l and -r only read the streams holding matching titles.
+    -k [CHECKPOINT_DIR]         Stream as with -s, saving progress and the outputs so far into CHECKPOINT_DIR every 10 minutes. Removed once the run completes.
+    -K [SECONDS]                Seconds between checkpoints with -k.
+    --resume                    With -k, carry on from the checkpoint in CHECKPOINT_DIR of an interrupted run with the same options. Outputs match an uninterrupted run.
+    -I [STATE_FILE]             Incremental run over a newer dump from bz2 or gz file. STATE_FILE keeps the last revision of every page, only later revisions are parsed into edits. Their tuples and titles are added to existing -t and -d files, -f gets only the new edits. Articles are numbered by page ID as with -X, by default in STATE_FILE.articles. Needs the same -y, -e, -D and -W on every run, and can not be used with -k, -a or -S.
+    -w [WORKERS]                Stream a single stream bz2 or gz file as with -s through a pipeline: a thread decompresses batches of pages while WORKERS processes parse, diff and find the words of their edits. Prints how busy every stage was. Can not be used with -m or -k.
+    -X [INDEX_FILE]             Number articles of a bz2 or gz file by page ID with the article index table in INDEX_FILE, memory-mapped, adding the articles numbered for the first time. Articles keep their number in every run and every output. Can not be used with -k.
     ''')
     print(f'ERROR: {error_message}')
     sys.exit(status)
@@ -38,56 +74,283 @@ def save_object(object, file_name):
         pickle.dump(object, object_file)
         object_file.close()
 
-def dict_save_tuples(data, file_name, min_timestamp, max_timestamp):
-    '''Function will parse tuples from dictionary data and save into file_name specified'''
+def sort_tuples(gen_obj, memory_budget=None):
+    '''
+    Returns tuples sorted by their first value, as a list
+    memory_budget : bytes of tuples to keep in memory, sorted runs past it are spilled to disk and merged by the generator returned instead
+    '''
+    if memory_budget is None:
+        print('Expanding into list')
+        list_obj = list(gen_obj)
+        print(f'Sorting tuples list of length {len(list_obj)}...')
+        with metrics.stage('sort'):
+            tuples = sorted(list_obj, key=lambda tup: tup[0])
+        print("Sorting complete")
+        return tuples
+    print(f'Sorting tuples on disk with a memory budget of {memory_budget} bytes...')
+    return external_sort(gen_obj, lambda tup: tup[0], memory_budget)
+
+def save_sorted_tuples(sorted_tuples, file_name, shard_writer=None):
+    '''
+    Saves sorted tuples, a list or a generator, as a list into file_name and into the shards of shard_writer
+    Either output can be skipped with an empty file_name or no shard_writer
+    '''
+    if shard_writer is not None:
+        print(f'Writing tuple shards to {shard_writer.shard_dir}...')
+        if isinstance(sorted_tuples, list):
+            shard_writer.write_tuples(sorted_tuples)
+        else:
+            sorted_tuples = shard_writer.yield_tuples(sorted_tuples)
+    if not file_name:
+        for tup in sorted_tuples:
+            pass
+    elif isinstance(sorted_tuples, list):
+        save_object(sorted_tuples, file_name)
+    else:
+        save_list_stream(sorted_tuples, file_name)
+    print("Tuples saved")
 
-    '''Yield and sort tuples'''
-    print('Loading into generator object')
-    gen_obj = dict_yield_tuples(data, min_timestamp, max_timestamp)
-    print('Expanding into list')
-    list_obj = list(gen_obj)
-    print(f'Sorting tuples list of length {len(list_obj)}...')
-    tuples = sorted(list_obj, key=lambda tup: tup[0])
+def merge_saved_tuples(sorted_tuples, file_name):
+    '''Loads the sorted tuples saved in file_name and returns them merged with sorted_tuples, in the same order as one stable sort'''
+    with open(file_name, 'rb') as read_file:
+        saved_tuples = pickle.load(read_file)
+    return heapq.merge(saved_tuples, sorted_tuples, key=lambda tup: tup[0])
 
-    print("Sorting complete and saving to file")
-    save_object(tuples, file_name)
+def merge_saved_titles(numbered_titles, file_name, page_totals=None):
+    '''
+    Returns the numbered titles saved in file_name updated with numbered_titles, sorted by index
+    A title numbered in both keeps the new title and total timestamps, and adds up usable timestamps
+    page_totals : optional dictionary of index -> (title, number of ts) of pages parsed again, as filled by yield_page_totals.
+                  Saved titles of these take the new title and total timestamps even without new usable timestamps
+    '''
+    with open(file_name, 'r') as read_file:
+        saved_titles = {int(index) : entry for index, entry in json.load(read_file).items()}
+    for index, (title, total) in (page_totals or {}).items():
+        if index in saved_titles and index not in numbered_titles:
+            saved_counts = next(iter(saved_titles[index].values()))
+            saved_titles[index] = {title : dict(saved_counts, total_timestamps=total)}
+    for index, entry in numbered_titles.items():
+        if index in saved_titles:
+            saved_counts = next(iter(saved_titles[index].values()))
+            entry = {title : dict(counts, usable_timestamps=saved_counts['usable_timestamps'] + counts['usable_timestamps']) for title, counts in entry.items()}
+        saved_titles[index] = entry
+    return dict(sorted(saved_titles.items()))
 
-def parse_tuples_and_save(data_file, save_file, min_timestamp, max_timestamp):
-    '''Function will get tuples from json data file and save to pickle file'''
+def yield_page_totals(pages, article_index, page_totals):
+    '''Passes pages from article_index.keyed_pages through, keeping (title, number of ts) of every page it already numbered in page_totals'''
+    for title, title_dict in pages:
+        index = article_index.get(article_index.page_id)
+        if index is not None:
+            page_totals[index] = (title, title_dict.get('number of ts'))
+        yield title, title_dict
 
-    print("Opening data file...")
-    with open(data_file, 'r') as read_file:
-        print("Loading into file using ijson...")
-        events = ijson.basic_parse(read_file)
-        print("Loaded into ijson object!")
-    
-        print("Loading generator object...")
-        gen_obj = basic_parse_yield_tuples(events, min_timestamp, max_timestamp)
+def json_pages(read_file):
+    '''Yields (title, title dictionary) from a json data file, one title at a time'''
+    return ijson.kvitems(read_file, '', use_float=True)
 
-        print("Expanding object into list...")
-        list_obj = list(gen_obj)
+def columns_save(columns, file_name):
+    '''Sorts tuple columns by time and saves them into file_name, as a tuple store if it has the .tuples extension or else as npz'''
+    print(f'Sorting {len(columns["times"])} tuples as columns...')
+    with metrics.stage('sort'):
+        columns = sort_tuple_columns(columns)
+    print(f'Sorting complete and saving to {file_name}')
+    with metrics.stage('write'):
+        if file_name.endswith(STORE_EXTENSION):
+            save_tuple_store(columns, file_name)
+        else:
+            save_tuple_columns(columns, file_name)
 
-        read_file.close()
+def yield_json_pages(pages, outfile, pages_written=None):
+    '''
+    Writes each (title, title dictionary) to outfile in the same format as json.dump(store), passing the pages on
+    pages_written : number of pages already in outfile, when carrying on with a dictionary that was started
+    '''
+    if pages_written is None:
+        outfile.write('{')
+    first = not pages_written
+    for title, title_dict in pages:
+        if not first:
+            outfile.write(', ')
+        first = False
+        outfile.write(json.dumps(title))
+        outfile.write(': ')
+        json.dump(title_dict, outfile)
+        yield title, title_dict
+    outfile.write('}')
 
-    # get list sorted by the first value
-    print(f'Sorting tuples list of length {len(list_obj)}...')
-    tuples = sorted(list_obj, key=lambda tup: tup[0])
+def parse_window(dict_file, min_timestamp, max_timestamp):
+    '''Timestamps the parser can skip revisions outside of, None if a parsed dictionary is saved since it keeps every revision'''
+    if dict_file:
+        return None
+    return (min_timestamp, max_timestamp)
 
-    '''Save objects to files'''
-    print("Sorting complete and saving to file")
-    save_object(tuples, save_file)
+def stream_parse_and_save(data_file, file_type, json_file, tuples_file, titles_file, min_timestamp, max_timestamp, index_file=None, processes=None, engine='lines', columns_file='', memory_budget=None, page_filter=None, checkpointer=None, shard_dir='', shard_sizes=(MONTHS_PER_SHARD, ARTICLES_PER_SHARD), vocab_file='', diff='set', page_states=None, article_index=None, workers=None, wikitext=False):
+    '''
+    Function will parse the data file one article at a time, feeding every output as each article closes
+    Any of json_file, tuples_file, titles_file, columns_file and shard_dir can be empty to skip that output
+    checkpointer : optional Checkpointer, progress is saved to it and a checkpoint it loaded is carried on from
+    page_states : optional PageStateWriter, only revisions after the ones in its state file are parsed
+    article_index : optional ArticleIndex with a table file, pages are then numbered by page ID
+    workers : parse a single stream file in a PagePipeline of this many worker processes, also finding the edits of the tuples
+    wikitext : clean wikitext markup out of every revision before diffing
+    '''
+    window = parse_window(json_file, min_timestamp, max_timestamp)
+    states = page_states.file_name if page_states is not None else None
+    page_ids = article_index is not None
+    pipeline = None
+    if workers:
+        pipeline = PagePipeline(data_file, file_type, workers, engine, window, page_filter, diff, states, page_ids, wikitext, (min_timestamp, max_timestamp))
+        pages = pipeline.pages()
+    elif checkpointer is None:
+        pages = parse_pages(data_file, file_type, index_file, processes, engine, window, page_filter, diff, states, page_ids, wikitext)
+    else:
+        resume = checkpointer.state['position'] if checkpointer.state else None
+        pages = parse_positioned_pages(data_file, file_type, index_file, processes, engine, window, page_filter, resume, diff, states, page_ids, wikitext)
+    edits_of = pipeline.page_edits if pipeline is not None else None
+    stream_save(pages, json_file, tuples_file, titles_file, min_timestamp, max_timestamp, columns_file, memory_budget, checkpointer, shard_dir, shard_sizes, vocab_file, page_states, article_index, edits_of)
+    if pipeline is not None:
+        pipeline.print_stats()
 
-def make_dict_from_json(data_file, output_file, min_timestamp, max_timestamp):
-    '''Will make dictionary from parsing json'''
-    print("Opening data file...")
-    with open(data_file, 'r') as read_file:
-        print("Loading into file using ijson...")
-        events = ijson.basic_parse(read_file)
-        print("Loaded into ijson object!")
-    
-        print("Making dictionary...")
-        basic_parse_make_numbered_titles_file(events, output_file, min_timestamp, max_timestamp)
+def stream_save(pages, dict_file, tuples_file, titles_file, min_timestamp, max_timestamp, columns_file='', memory_budget=None, checkpointer=None, shard_dir='', shard_sizes=(MONTHS_PER_SHARD, ARTICLES_PER_SHARD), vocab_file='', page_states=None, article_index=None, edits_of=None):
+    '''
+    Feeds an iterable of (title, title dictionary) into every output in a single pass, one title at a time
+    Any of dict_file, tuples_file, titles_file, columns_file and shard_dir can be empty to skip that output
+    dict_file is written as json, or as a binary page file if it has the .pages extension
+    shard_dir : directory for tuples and titles partitioned by time and by article, shard_sizes is (months, articles) per shard
+    vocab_file : words of the columns are then token IDs, with the vocabulary saved into vocab_file. Tuples and shards keep their words
+    checkpointer : optional Checkpointer, pages are then (title, title dictionary, position) as yielded by parse_positioned_pages.
+                   Outputs are checkpointed as they go, and carried on from the checkpoint it loaded
+    article_index : optional ArticleIndex with a table file, pages then hold the 'page id' the parser gave them and are numbered by it.
+                    The table is saved with the pages numbered in this run
+    page_states : optional PageStateWriter, needs article_index. Pages then also hold the 'state' the parser gave them,
+                  and tuples and titles are added to the ones already in tuples_file and titles_file
+    edits_of : optional function giving the edits of a page, see stream_yield_tuples
+    '''
+    resume = checkpointer.state if checkpointer is not None else None
+    numbered_titles = {}
+    dict_size = None
+    if resume is not None:
+        numbered_titles = checkpointer.load_titles()
+        dict_size = resume['dict_size']
+    # pages of an earlier run parsed again, their saved titles need the new total timestamps
+    page_totals = {}
+    keyed = article_index is not None
+    if keyed:
+        if page_states is not None:
+            pages = page_states.track(pages)
+        pages = article_index.keyed_pages(pages)
+        if page_states is not None:
+            pages = yield_page_totals(pages, article_index, page_totals)
+    else:
+        article_index = ArticleIndex(start_index=len(numbered_titles))
+
+    if checkpointer is not None:
+        # checkpoints are saved as the outputs below ask for the next page
+        pages = checkpointer.track(pages, lambda position: save_checkpoint(position))
+    recorder = metrics.METRICS
+    if recorder is not None:
+        pages = recorder.meter_pages(pages)
+    if dict_file.endswith(PAGES_EXTENSION):
+        print(f'Streaming pages to {dict_file}...')
+        dict_output = PageWriter(dict_file, dict_size)
+        pages = dict_output.yield_pages(pages)
+    elif dict_file and dict_size is None:
+        print(f'Streaming dictionary to {dict_file}...')
+        dict_output = open(dict_file, 'w')
+        pages = yield_json_pages(pages, dict_output)
+    elif dict_file:
+        print(f'Carrying on with dictionary in {dict_file}...')
+        dict_output = open(dict_file, 'r+')
+        dict_output.truncate(dict_size)
+        dict_output.seek(dict_size)
+        pages = yield_json_pages(pages, dict_output, resume['pages'])
+    if dict_file and recorder is not None:
+        # time past the parser's is spent writing
+        pages = recorder.timed(pages, 'pages_out')
+    vocabulary = None
+    if vocab_file:
+        vocabulary = checkpointer.load_vocabulary() if resume is not None else open_vocabulary(vocab_file)
+    # columns are built from the same edits as the tuples
+    on_page = None
+    if columns_file:
+        builder = TupleColumnsBuilder(min_timestamp, max_timestamp, vocabulary=vocabulary)
+        if resume is not None:
+            builder.batches = checkpointer.load_batches()
+        on_page = builder.on_page
+
+    # outputs since the last checkpoint
+    new_tuples = []
+    saved_titles = len(numbered_titles)
+    saved_batches = len(builder.batches) if columns_file else 0
 
+    def save_checkpoint(position):
+        nonlocal saved_titles, saved_batches
+        new_tuples.sort(key=lambda tup: tup[0])
+        new_titles = {index : numbered_titles[index] for index in range(saved_titles, len(numbered_titles))}
+        batches = []
+        if columns_file:
+            builder.flush()
+            batches = builder.batches[saved_batches:]
+            saved_batches = len(builder.batches)
+        size = None
+        if dict_file:
+            dict_output.flush()
+            size = dict_output.tell()
+        checkpointer.save(position, size, new_tuples, new_titles, batches, vocabulary)
+        new_tuples.clear()
+        saved_titles = len(numbered_titles)
+
+    print('Streaming articles into tuples...')
+    gen_obj = stream_yield_tuples(pages, min_timestamp, max_timestamp, numbered_titles, on_page, article_index, edits_of)
+    if recorder is not None:
+        gen_obj = recorder.meter_tuples(gen_obj)
+    shard_writer = None
+    if shard_dir:
+        shard_writer = ShardWriter(shard_dir, min_timestamp, max_timestamp, *shard_sizes)
+    if (tuples_file or shard_dir) and checkpointer is not None:
+        for tup in gen_obj:
+            new_tuples.append(tup)
+        # every checkpoint holds a sorted run, merge them with the rest
+        print(f'Merging tuples of {len(checkpointer.shards["tuples"])} checkpoints...')
+        with metrics.stage('sort'):
+            new_tuples.sort(key=lambda tup: tup[0])
+        save_sorted_tuples(checkpointer.merge_tuples(new_tuples, lambda tup: tup[0]), tuples_file, shard_writer)
+    elif tuples_file or shard_dir:
+        sorted_tuples = sort_tuples(gen_obj, memory_budget)
+        if page_states is not None and os.path.exists(tuples_file):
+            print(f'Adding to the tuples in {tuples_file}...')
+            sorted_tuples = merge_saved_tuples(sorted_tuples, tuples_file)
+        save_sorted_tuples(sorted_tuples, tuples_file, shard_writer)
+    else:
+        for tup in gen_obj:
+            pass
+    with metrics.stage('write'):
+        if dict_file:
+            dict_output.close()
+        if titles_file:
+            if page_states is not None and os.path.exists(titles_file):
+                print(f'Adding to the titles in {titles_file}...')
+                numbered_titles = merge_saved_titles(numbered_titles, titles_file, page_totals)
+            print(f'Writing titles dictionary to {titles_file}...')
+            with open(titles_file, 'w') as output_file:
+                json.dump(numbered_titles, output_file)
+        if vocab_file:
+            print(f'Writing vocabulary of {len(vocabulary.ids)} tokens to {vocab_file}...')
+            vocabulary.save(vocab_file)
+        if shard_dir:
+            manifest = shard_writer.close(numbered_titles)
+            print(f'Wrote {len(manifest["time_shards"])} time shards and {len(manifest["article_shards"])} article shards')
+    if columns_file:
+        columns_save(builder.finish(), columns_file)
+    if checkpointer is not None:
+        checkpointer.finish()
+    if keyed:
+        article_index.save()
+        article_index.close()
+    if page_states is not None:
+        page_states.close()
+        # readers cached by file name would read the replaced file
+        open_page_states.cache_clear()
 
 def main():
     '''Set variables'''
@@ -101,15 +364,40 @@ def main():
     output_json_file = ''
     output_tuples_file = ''
     output_titles_file = ''
+    output_columns_file = ''
     json_file = False
+    pages_file = False
     save_json_file = False
     save_tuples_file = False
     save_titles_file = False
+    save_columns_file = False
+    save_shards = False
+    shard_dir = ''
+    shard_sizes = (MONTHS_PER_SHARD, ARTICLES_PER_SHARD)
+    vocab_file = ''
+    metrics_file = None
+    stream = False
+    index_file = None
+    processes = None
+    engine = 'lines'
+    diff = 'set'
+    wikitext = False
+    memory_budget = None
+    namespaces = None
+    titles = None
+    title_regex = None
+    titles_file = None
+    checkpoint_dir = None
+    checkpoint_seconds = CHECKPOINT_SECONDS
+    resume = False
+    state_file = None
+    article_index_file = None
+    workers = None
     
     '''Check data file'''
     if data_file.endswith('.bz2'):
-        if not data_file.endswith('pages-meta-history.xml.bz2'):
-            usage(2, 'File must be in format idwiki-date-pages-meta-history.xml.bz2')
+        if not data_file.endswith('pages-meta-history.xml.bz2') and not data_file.endswith('multistream.xml.bz2'):
+            usage(2, 'File must be in format idwiki-date-pages-meta-history.xml.bz2 or idwiki-date-pages-articles-multistream.xml.bz2')
         file_type = 'bz2'
     elif data_file.endswith('.gz'):
         if not data_file.endswith('pages-meta-history.xml.gz'):
@@ -117,6 +405,8 @@ def main():
         file_type = 'gz'
     elif data_file.endswith('.json'):
         json_file = True
+    elif data_file.endswith(PAGES_EXTENSION):
+        pages_file = True
     else:
         usage(2, 'Unsupported data file extension')
 
@@ -128,11 +418,11 @@ def main():
         elif arg == '-f':
             output_json_file = arguments.pop(0)
             save_json_file = True
-            if not output_json_file.endswith('.json'):
-                print('Output file must be a json file')
+            if not output_json_file.endswith('.json') and not output_json_file.endswith(PAGES_EXTENSION):
+                print(f'Output file must be a json or {PAGES_EXTENSION} file')
                 exit(2)
-            if json_file:
-                print('Data file already in json format')
+            if json_file or pages_file:
+                print('Data file already parsed')
                 exit(2)
         elif arg == '-t':
             output_tuples_file = arguments.pop(0)
@@ -140,43 +430,169 @@ def main():
         elif arg == '-d':
             output_titles_file = arguments.pop(0)
             save_titles_file = True
+        elif arg == '-a':
+            output_columns_file = arguments.pop(0)
+            save_columns_file = True
+        elif arg == '-S':
+            shard_dir = arguments.pop(0)
+            save_shards = True
+        elif arg == '-P':
+            shard_sizes = (int(arguments.pop(0)), int(arguments.pop(0)))
+        elif arg == '-L':
+            metrics_file = arguments.pop(0)
+        elif arg == '-V':
+            vocab_file = arguments.pop(0)
         elif arg == '-y':
             min_year = int(arguments.pop(0))
             max_year = int(arguments.pop(0))
+        elif arg == '-s':
+            stream = True
+        elif arg == '-m':
+            index_file = arguments.pop(0)
+            if file_type != 'bz2':
+                usage(2, 'Multistream index can only be used with a bz2 data file')
+        elif arg == '-p':
+            processes = int(arguments.pop(0))
+        elif arg == '-w':
+            workers = int(arguments.pop(0))
+            stream = True
+        elif arg == '-e':
+            engine = arguments.pop(0)
+            if engine not in PARSE_ENGINES:
+                usage(2, f'Parser engine must be one of {", ".join(PARSE_ENGINES)}')
+        elif arg == '-D':
+            diff = arguments.pop(0)
+            if diff not in DIFF_MODES:
+                usage(2, f'Diff mode must be one of {", ".join(DIFF_MODES)}')
+        elif arg == '-W':
+            wikitext = True
+        elif arg == '-z':
+            try:
+                decompress.set_backend(arguments.pop(0))
+            except ValueError as error:
+                usage(2, str(error))
+        elif arg == '-c':
+            set_word_cache_size(int(arguments.pop(0)))
+        elif arg == '-M':
+            memory_budget = int(float(arguments.pop(0)) * 1024 * 1024)
+        elif arg == '-n':
+            namespaces = [int(ns) for ns in arguments.pop(0).split(',')]
+        elif arg == '-l':
+            titles_file = arguments.pop(0)
+            titles = load_titles(titles_file)
+        elif arg == '-r':
+            title_regex = arguments.pop(0)
+        elif arg == '-k':
+            checkpoint_dir = arguments.pop(0)
+            stream = True
+            if json_file or pages_file:
+                usage(2, 'Checkpoints can only be made while parsing a bz2 or gz file')
+        elif arg == '-K':
+            checkpoint_seconds = float(arguments.pop(0))
+        elif arg == '--resume':
+            resume = True
+        elif arg == '-I':
+            state_file = arguments.pop(0)
+            if json_file or pages_file:
+                usage(2, 'Incremental runs need a bz2 or gz data file')
+        elif arg == '-X':
+            article_index_file = arguments.pop(0)
+            if json_file or pages_file:
+                usage(2, 'Articles can only be numbered by page ID while parsing a bz2 or gz file')
         else:
             usage(3, 'Incorrect Argument')
     
+    page_filter = None
+    if namespaces is not None or titles is not None or title_regex is not None:
+        page_filter = PageFilter(namespaces, titles, title_regex)
+
     '''Convert years to min and max timestamp'''
     dt_min = dt.datetime(min_year, 1, 1)
     dt_max = dt.datetime(max_year, 12, 31, 23, 59) # will get all of the year
     min_timestamp = float( dt_min.replace(tzinfo=dt.timezone.utc).timestamp() )
     max_timestamp = float( dt_max.replace(tzinfo=dt.timezone.utc).timestamp() )
 
+    if workers is not None:
+        if json_file or pages_file:
+            usage(2, 'The pipeline can only parse a bz2 or gz file')
+        if index_file or checkpoint_dir is not None:
+            usage(2, '-w can not be used with -m or -k')
+
+    # only the columns are small enough for IDs to pay off, an array of IDs per tuple is bigger than its words
+    if vocab_file and (not save_columns_file or output_columns_file.endswith(STORE_EXTENSION)):
+        usage(2, '-V needs -a with an npz file')
+
+    checkpointer = None
+    if checkpoint_dir is not None:
+        # everything the outputs depend on, a checkpoint is only resumed with the same
+        options = {
+            'data_file' : os.path.abspath(data_file),
+            'outputs' : [output_json_file, output_tuples_file, output_titles_file, output_columns_file, shard_dir, list(shard_sizes), vocab_file],
+            'timestamps' : [min_timestamp, max_timestamp],
+            'index_file' : index_file,
+            'engine' : engine,
+            'diff' : diff,
+            'wikitext' : wikitext,
+            'namespaces' : namespaces,
+            'titles_file' : titles_file,
+            'title_regex' : title_regex,
+        }
+        checkpointer = Checkpointer(checkpoint_dir, options, resume, checkpoint_seconds)
+    elif resume:
+        usage(2, '--resume needs a checkpoint directory from -k')
+
+    page_states = None
+    if state_file is not None:
+        if checkpoint_dir is not None or save_columns_file or save_shards:
+            usage(2, '-I can not be used with -k, -a or -S')
+        if not (save_json_file or save_tuples_file or save_titles_file):
+            usage(2, '-I needs an output from -f, -t or -d')
+        # tuples of every run must be comparable
+        state_options = {'timestamps' : [min_timestamp, max_timestamp], 'engine' : engine, 'diff' : diff}
+        if wikitext:
+            # only when set, so state files of earlier runs still match
+            state_options['wikitext'] = True
+        page_states = PageStateWriter(state_file, state_options)
+        if article_index_file is None:
+            article_index_file = state_file + ARTICLE_INDEX_EXTENSION
+
+    article_index = None
+    if article_index_file is not None:
+        if checkpoint_dir is not None:
+            usage(2, '-X can not be used with -k')
+        article_index = ArticleIndex(article_index_file)
+
+    if metrics_file is not None:
+        metrics.start_metrics(metrics_file)
+
     '''Execute functions for data file'''
-    if not json_file and (save_tuples_file or save_json_file or save_titles_file):
+    if stream and not json_file and not pages_file and (save_tuples_file or save_json_file or save_titles_file or save_columns_file or save_shards):
+        print(f'Starting to stream through {data_file}')
+        stream_parse_and_save(data_file, file_type, output_json_file, output_tuples_file, output_titles_file, min_timestamp, max_timestamp, index_file, processes, engine, output_columns_file, memory_budget, page_filter, checkpointer, shard_dir, shard_sizes, vocab_file, diff, page_states, article_index, workers, wikitext)
+
+    elif not json_file and not pages_file and (save_tuples_file or save_json_file or save_titles_file or save_columns_file or save_shards):
         print(f'Starting to parse through {data_file}')
-        store = parse_file(data_file, file_type)
-        if save_json_file:
-            print(f'Writing dictionary to {output_json_file}...')
-            with open(output_json_file, 'w') as outfile:
-                    json.dump(store, outfile)
-            print('Saved to json file ')
-        if save_tuples_file:
-            print(f'Starting to write tuples list to file {output_tuples_file}...')
-            dict_save_tuples(store, output_tuples_file, min_timestamp, max_timestamp)
-        if save_titles_file:
-            print(f'Writing titles dictionary to {output_titles_file}...')
-            dict_make_numbered_titles_file(store, output_titles_file, min_timestamp, max_timestamp)
-
-    elif json_file and (save_tuples_file or save_titles_file):
-        if save_tuples_file:
-            parse_tuples_and_save(data_file, output_tuples_file, min_timestamp, max_timestamp)
-        if save_titles_file:
-            make_dict_from_json(data_file, output_titles_file, min_timestamp, max_timestamp)
+        with metrics.stage('pages'):
+            store = parse_file(data_file, file_type, index_file, processes, engine, parse_window(output_json_file, min_timestamp, max_timestamp), page_filter, diff, state_file, article_index is not None, wikitext)
+        print('Writing outputs from dictionary...')
+        stream_save(store.items(), output_json_file, output_tuples_file, output_titles_file, min_timestamp, max_timestamp, output_columns_file, memory_budget, None, shard_dir, shard_sizes, vocab_file, page_states, article_index)
+
+    elif json_file and (save_tuples_file or save_titles_file or save_columns_file or save_shards):
+        print(f'Starting to read dictionary from {data_file}')
+        with open(data_file, 'r') as read_file:
+            stream_save(json_pages(read_file), '', output_tuples_file, output_titles_file, min_timestamp, max_timestamp, output_columns_file, memory_budget, None, shard_dir, shard_sizes, vocab_file)
+
+    elif pages_file and (save_tuples_file or save_titles_file or save_columns_file or save_shards):
+        print(f'Starting to read pages from {data_file}')
+        stream_save(read_pages(data_file), '', output_tuples_file, output_titles_file, min_timestamp, max_timestamp, output_columns_file, memory_budget, None, shard_dir, shard_sizes, vocab_file)
 
     else:
         usage(4, 'No instructions specified')
 
+    metrics.finish_metrics()
+    cache_info = word_cache_info()
+    if cache_info.hits or cache_info.misses:
+        print(f'Word cache: {cache_info.hits} hits, {cache_info.misses} misses, {cache_info.currsize} strings')
     print('Complete')
         
 # Main Execution
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+from multiprocessing import Pool
+# include these scripts in same directory
+import metrics
+import decompress
+from xml_parse import PARSE_ENGINES
+from wiki_parser3 import page_edits
+
+# Decompressed bytes of pages sent to a worker at once, cut after the first </page> past it
+BATCH_BYTES = 4 << 20
+# Batches waiting between stages, per worker
+QUEUE_BATCHES = 2
+# Entries the parser adds to a page besides its timestamps
+PAGE_INFO = ('number of ts', 'page id', 'state')
+
+# Staged pipeline for a single stream bz2 or gz file:
+#
+#     decompress thread  ->  queue of page batches  ->  worker processes  ->  pages in file order
+#                                                       parse, diff and
+#                                                       normalize a batch
+#
+# The thread spends its time in the decompressor, which lets go of the GIL. Both the queue and the batches
+# sent to workers are bounded, so a slow stage holds the others back instead of filling memory. Every stage
+# keeps its busy and waiting seconds, the slowest stage is the one that is busy the whole time.
+
+def parse_batch(args):
+    '''Worker for PagePipeline, returns (list of (title, page dictionary), list of edits of every page, parse seconds, normalize seconds)'''
+    data, engine, window, page_filter, diff, states, page_ids, wikitext, edits_window = args
+    start = time.perf_counter()
+    lines = data.splitlines(keepends=True)
+    if engine == 'pull' and not data.lstrip().startswith(b'<mediawiki'):
+        # page batches have no root element, give them one (never closed, so the footer is not needed)
+        lines.insert(0, b'<mediawiki>\n')
+    pages = list(PARSE_ENGINES[engine](lines, window, page_filter, diff, states, page_ids, wikitext))
+    parsed = time.perf_counter()
+    edits = None
+    if edits_window is not None:
+        edits = [page_edits(timestamps_only(title_dict), *edits_window) for title, title_dict in pages]
+    return pages, edits, parsed - start, time.perf_counter() - parsed
+
+def timestamps_only(title_dict):
+    '''The title dictionary without the entries the parser may add for other outputs'''
+    if 'page id' not in title_dict and 'state' not in title_dict:
+        return title_dict
+    return {timestamp : edit for timestamp, edit in title_dict.items() if timestamp not in PAGE_INFO}
+
+class PagePipeline:
+    '''
+    Parses a bz2 or gz file with one thread decompressing and workers processes parsing, diffing and normalizing batches of pages
+    engine, window, page_filter, diff, states, page_ids and wikitext are the same as for xml_parse.parse_pages
+    edits_window : optional (min_timestamp, max_timestamp), the workers then also find the edits of every page, given back by page_edits
+    '''
+    def __init__(self, data_file, file_type, workers=None, engine='lines', window=None, page_filter=None, diff='set', states=None, page_ids=False, wikitext=False, edits_window=None, batch_bytes=BATCH_BYTES):
+        self.data_file = data_file
+        self.file_type = file_type
+        self.workers = workers or os.cpu_count() or 1
+        self.options = (engine, window, page_filter, diff, states, page_ids, wikitext, edits_window)
+        self.edits_window = edits_window
+        self.batch_bytes = batch_bytes
+        self.batches = queue.Queue(maxsize=QUEUE_BATCHES * self.workers)
+        self.stopped = threading.Event()
+        self.error = None
+        self.edits = {} # id of a page dictionary passed on -> its edits
+        self.start = None
+        self.seconds = dict.fromkeys(('decompress', 'decompress_blocked', 'parse', 'normalize', 'wait_batches', 'wait_workers', 'outputs'), 0.0)
+        self.counts = dict.fromkeys(('batches', 'sent', 'queued', 'compressed_bytes', 'decompressed_bytes'), 0)
+
+    def decompress(self):
+        '''Thread reading the data file into page batches, None marks the end'''
+        try:
+            with decompress.open_decompressed(self.data_file, self.file_type) as (raw, read_file):
+                rest = b''
+                while not self.stopped.is_set():
+                    start = time.perf_counter()
+                    chunk = read_file.read(self.batch_bytes)
+                    self.seconds['decompress'] += time.perf_counter() - start
+                    self.counts['compressed_bytes'] = raw.tell()
+                    self.counts['decompressed_bytes'] += len(chunk)
+                    if not chunk:
+                        if rest:
+                            self.put(rest)
+                        break
+                    data = rest + chunk if rest else chunk
+                    end = data.rfind(b'</page>')
+                    if end < 0:
+                        # a page longer than a batch
+                        rest = data
+                        continue
+                    end = data.find(b'\n', end) + 1 or len(data)
+                    rest = data[end:]
+                    self.put(data[:end])
+        except BaseException as error:
+            self.error = error
+        finally:
+            self.put(None)
+
+    def put(self, batch):
+        '''Waits for room in the queue, unless the pipeline was stopped'''
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                self.batches.put(batch, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.seconds['decompress_blocked'] += time.perf_counter() - start
+
+    def pages(self):
+        '''Yields (title, page dictionary) in file order, the same as xml_parse.parse_pages'''
+        self.start = time.perf_counter()
+        thread = threading.Thread(target=self.decompress, daemon=True)
+        thread.start()
+        try:
+            with Pool(self.workers) as pool:
+                pending = deque()
+                finished = False
+                while True:
+                    # keep a bounded number of batches in the workers
+                    while not finished and len(pending) < QUEUE_BATCHES * self.workers:
+                        start = time.perf_counter()
+                        batch = self.batches.get()
+                        self.seconds['wait_batches'] += time.perf_counter() - start
+                        if batch is None:
+                            finished = True
+                            break
+                        # how far decompression is ahead
+                        self.counts['sent'] += 1
+                        self.counts['queued'] += self.batches.qsize()
+                        pending.append(pool.apply_async(parse_batch, ((batch,) + self.options,)))
+                    if not pending:
+                        break
+                    start = time.perf_counter()
+                    pages, edits, parse_seconds, normalize_seconds = pending.popleft().get()
+                    self.seconds['wait_workers'] += time.perf_counter() - start
+                    self.seconds['parse'] += parse_seconds
+                    self.seconds['normalize'] += normalize_seconds
+                    self.counts['batches'] += 1
+                    self.record()
+                    for number, (title, title_dict) in enumerate(pages):
+                        if edits is not None:
+                            self.edits[id(title_dict)] = edits[number]
+                        start = time.perf_counter()
+                        yield title, title_dict
+                        self.seconds['outputs'] += time.perf_counter() - start
+        finally:
+            self.stopped.set()
+            thread.join()
+            self.record()
+        if self.error is not None:
+            raise self.error
+
+    def page_edits(self, title_dict, min_timestamp, max_timestamp):
+        '''Same as wiki_parser3.page_edits, with the edits the workers found for the pages passed on'''
+        edits = self.edits.pop(id(title_dict), None)
+        if edits is None or (min_timestamp, max_timestamp) != self.edits_window:
+            return page_edits(title_dict, min_timestamp, max_timestamp)
+        return edits
+
+    def stats(self):
+        '''Busy and waiting seconds of every stage, with the fraction of the time so far each stage was busy'''
+        wall = max(time.perf_counter() - self.start, 1e-9) if self.start is not None else 1e-9
+        seconds = self.seconds
+        worker_seconds = seconds['parse'] + seconds['normalize']
+        return {
+            'workers' : self.workers,
+            'batches' : self.counts['batches'],
+            'mean_queued' : round(self.counts['queued'] / max(self.counts['sent'], 1), 2),
+            'seconds' : {name : round(value, 3) for name, value in seconds.items()},
+            'utilization' : {
+                'decompress' : round(seconds['decompress'] / wall, 3),
+                'workers' : round(worker_seconds / (wall * self.workers), 3),
+                'outputs' : round(seconds['outputs'] / wall, 3),
+            },
+        }
+
+    def record(self):
+        '''Puts the stats into the metrics records'''
+        recorder = metrics.METRICS
+        if recorder is None:
+            return
+        recorder.sections['pipeline'] = self.stats()
+        recorder.counters['compressed_bytes'] = self.counts['compressed_bytes']
+        recorder.counters['decompressed_bytes'] = self.counts['decompressed_bytes']
+
+    def print_stats(self):
+        stats = self.stats()
+        utilization = stats['utilization']
+        seconds = stats['seconds']
+        print(f'Pipeline of {self.workers} workers over {stats["batches"]} batches, {stats["mean_queued"]} batches queued on average')
+        print(f'    decompress {utilization["decompress"]:.0%} busy, {seconds["decompress_blocked"]} s blocked on a full queue')
+        print(f'    workers    {utilization["workers"]:.0%} busy, parse and diff {seconds["parse"]} s, normalize {seconds["normalize"]} s')
+        print(f'    outputs    {utilization["outputs"]:.0%} busy, {seconds["wait_workers"]} s waiting on workers, {seconds["wait_batches"]} s on decompression')
+        slowest = max(utilization, key=utilization.get)
+        print(f'    slowest stage: {slowest}')
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from difflib import SequenceMatcher
+
+# Largest region without unique anchors, in pairs of tokens, left to difflib, bigger ones count as replaced whole
+MATCHER_CELLS = 1 << 16
+
+# Patience diff of token lists: edits of a revision are mostly in one place, so the common start and end
+# are cut off first with slice comparisons, done in C. What is left is split at tokens found exactly once
+# on both sides, in the longest run of them in the same order, and each piece between them is diffed the
+# same way. Pieces with no such tokens go to difflib when small, else are taken as replaced.
+#
+# Texts are diffed by whole lines with the same algorithm first, lines being tuples of their tokens, so
+# only the tokens of changed lines are ever compared one by one.
+
+def common_prefix(a, b, a_lo, a_hi, b_lo, b_hi):
+    '''Length of the common start of a[a_lo:a_hi] and b[b_lo:b_hi], found by halving'''
+    lo, hi = 0, min(a_hi - a_lo, b_hi - b_lo)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[a_lo + lo:a_lo + mid] == b[b_lo + lo:b_lo + mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def common_suffix(a, b, a_lo, a_hi, b_lo, b_hi):
+    '''Length of the common end of a[a_lo:a_hi] and b[b_lo:b_hi], found by halving'''
+    lo, hi = 0, min(a_hi - a_lo, b_hi - b_lo)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[a_hi - mid:a_hi - lo] == b[b_hi - mid:b_hi - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    '''Returns (i, j) of tokens found once in a[a_lo:a_hi] and once in b[b_lo:b_hi], the longest run of them in the same order'''
+    a_counts = Counter(a[a_lo:a_hi])
+    b_counts = Counter(b[b_lo:b_hi])
+    b_positions = {token : j for j, token in enumerate(b[b_lo:b_hi], b_lo) if b_counts[token] == 1 and a_counts[token] == 1}
+    pairs = [(i, b_positions[token]) for i, token in enumerate(a[a_lo:a_hi], a_lo) if token in b_positions]
+    if not pairs:
+        return []
+    if all(j1 < j2 for (i1, j1), (i2, j2) in zip(pairs, pairs[1:])):
+        # nothing moved, the usual case
+        return pairs
+    # longest increasing run of b positions, by patience sorting
+    tails = [] # Smallest b position ending a run of each length
+    tail_pairs = [] # Index into pairs of each tail
+    previous = [None] * len(pairs)
+    for number, (i, j) in enumerate(pairs):
+        length = bisect_left(tails, j)
+        if length == len(tails):
+            tails.append(j)
+            tail_pairs.append(number)
+        else:
+            tails[length] = j
+            tail_pairs[length] = number
+        previous[number] = tail_pairs[length - 1] if length else None
+    anchors = []
+    number = tail_pairs[-1]
+    while number is not None:
+        anchors.append(pairs[number])
+        number = previous[number]
+    anchors.reverse()
+    return anchors
+
+def diff_tokens(a, b):
+    '''
+    Returns the changes turning token list a into b, as (i1, i2, j1, j2) sorted by position, a[i1:i2] being replaced by b[j1:j2]
+    i1 == i2 is an insertion and j1 == j2 a deletion, tokens outside the changes are equal
+    '''
+    changes = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = regions.pop()
+        if a[a_lo:a_hi] == b[b_lo:b_hi]:
+            continue
+        prefix = common_prefix(a, b, a_lo, a_hi, b_lo, b_hi)
+        a_lo += prefix
+        b_lo += prefix
+        suffix = common_suffix(a, b, a_lo, a_hi, b_lo, b_hi)
+        a_hi -= suffix
+        b_hi -= suffix
+        if a_lo == a_hi or b_lo == b_hi:
+            if a_lo < a_hi or b_lo < b_hi:
+                changes.append((a_lo, a_hi, b_lo, b_hi))
+            continue
+        if a_hi - a_lo == 1 and a[a_lo] in b[b_lo:b_hi]:
+            # one token left of a, keep it where b has it and insert around it
+            j = b.index(a[a_lo], b_lo, b_hi)
+            changes.extend(change for change in ((a_lo, a_lo, b_lo, j), (a_hi, a_hi, j + 1, b_hi)) if change[2] < change[3])
+            continue
+        if b_hi - b_lo == 1 and b[b_lo] in a[a_lo:a_hi]:
+            i = a.index(b[b_lo], a_lo, a_hi)
+            changes.extend(change for change in ((a_lo, i, b_lo, b_lo), (i + 1, a_hi, b_hi, b_hi)) if change[0] < change[1])
+            continue
+        anchors = unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchors:
+            # pieces between the anchors, the anchors themselves are equal
+            starts = [(a_lo, b_lo)] + [(i + 1, j + 1) for i, j in anchors]
+            ends = anchors + [(a_hi, b_hi)]
+            regions.extend((i1, i2, j1, j2) for (i1, j1), (i2, j2) in zip(starts, ends) if a[i1:i2] != b[j1:j2])
+        elif (a_hi - a_lo) * (b_hi - b_lo) <= MATCHER_CELLS:
+            matcher = SequenceMatcher(None, a[a_lo:a_hi], b[b_lo:b_hi], autojunk=False)
+            changes.extend((a_lo + i1, a_lo + i2, b_lo + j1, b_lo + j2) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal')
+        else:
+            changes.append((a_lo, a_hi, b_lo, b_hi))
+    changes.sort()
+    return changes
+
+def changed_lines(a_lines, b_lines):
+    '''
+    Yields (removed tokens, added tokens) of every change between two texts given as lists of token lists, one per line
+    Lines are compared whole first, tokens are only looked at in the lines that changed
+    '''
+    for i1, i2, j1, j2 in diff_tokens(list(map(tuple, a_lines)), list(map(tuple, b_lines))):
+        yield list(chain.from_iterable(a_lines[i1:i2])), list(chain.from_iterable(b_lines[j1:j2]))
+
+def changed_tokens(a_lines, b_lines):
+    '''Yields (removed tokens, added tokens) of every change between two texts given as lists of token lists, in text order'''
+    for a, b in changed_lines(a_lines, b_lines):
+        for i1, i2, j1, j2 in diff_tokens(a, b):
+            yield a[i1:i2], b[j1:j2]
+
+def diff_spans(a_lines, b_lines):
+    '''Returns (removed, added) lists of space separated runs of tokens, one for each side of every change in text order'''
+    removed = []
+    added = []
+    for a, b in changed_tokens(a_lines, b_lines):
+        if a:
+            removed.append(' '.join(a))
+        if b:
+            added.append(' '.join(b))
+    return removed, added
+
+def diff_counts(a_lines, b_lines):
+    '''Returns (removed, added) lists of tokens, every token as many times as its count went down or up'''
+    a_counts = Counter()
+    b_counts = Counter()
+    # lines left alone count the same on both sides
+    for a, b in changed_lines(a_lines, b_lines):
+        a_counts.update(a)
+        b_counts.update(b)
+    return list((a_counts - b_counts).elements()), list((b_counts - a_counts).elements())
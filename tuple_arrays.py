@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from array import array
+# include these scripts in same directory
+from wiki_parser3 import convert_secs_to_months
+
+class TupleColumnsBuilder:
+    '''
+    Builds the tuples of dict_yield_tuples as columns instead of one python tuple per edit, fed the edits of every page by stream_yield_tuples through on_page
+    times : float64 months since min_timestamp
+    indices : int32 article number
+    offsets : int64 start of the words of every edit in words, followed by the end of words
+    words : uint8 buffer of every edit's words, utf-8 encoded and concatenated
+    With a vocabulary.Vocabulary, words is replaced by
+    tokens : uint32 buffer of every edit's token IDs, offsets then count tokens instead of bytes
+    '''
+    def __init__(self, min_timestamp, max_timestamp, batch_size=100000, vocabulary=None):
+        self.min_timestamp = min_timestamp
+        self.max_timestamp = max_timestamp
+        self.batch_size = batch_size
+        self.vocabulary = vocabulary
+        self.batches = [] # Finished (times, indices, lengths, words) arrays
+        self.seconds = [] # Edits of the batch being built
+        self.indices = []
+        self.words = []
+
+    def add_edits(self, index, edits):
+        '''Adds the (timestamp in seconds, words) edits of the title numbered index, as returned by page_edits, and returns how many there were'''
+        for seconds, words in edits:
+            self.seconds.append(seconds)
+            if self.vocabulary is None:
+                self.words.append(words.encode())
+            else:
+                self.words.append(self.vocabulary.encode(words))
+        self.indices.extend([index] * len(edits))
+        if len(self.seconds) >= self.batch_size:
+            self.flush()
+        return len(edits)
+
+    def on_page(self, index, title, title_dict, edits):
+        '''Callback for stream_yield_tuples, adds the edits it already collected'''
+        self.add_edits(index, edits)
+
+    def flush(self):
+        '''Converts the batch being built into arrays'''
+        if not self.seconds:
+            return
+        times = convert_secs_to_months(np.array(self.seconds, dtype=np.float64) - self.min_timestamp)
+        indices = np.array(self.indices, dtype=np.int32)
+        lengths = np.fromiter(map(len, self.words), dtype=np.int64, count=len(self.words))
+        if self.vocabulary is not None:
+            self.words = [token_ids.tobytes() for token_ids in self.words]
+        self.batches.append((times, indices, lengths, b''.join(self.words)))
+        self.seconds = []
+        self.indices = []
+        self.words = []
+
+    def finish(self):
+        '''Returns the columns of every edit added, in the order they were added'''
+        self.flush()
+        if not self.batches:
+            columns = empty_tuple_columns()
+        else:
+            times, indices, lengths, words = zip(*self.batches)
+            lengths = np.concatenate(lengths)
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            columns = {
+                'times' : np.concatenate(times),
+                'indices' : np.concatenate(indices),
+                'offsets' : offsets,
+                'words' : np.frombuffer(b''.join(words), dtype=np.uint8),
+            }
+        if self.vocabulary is not None:
+            columns['tokens'] = columns.pop('words').view(np.uint32)
+        return columns
+
+def empty_tuple_columns():
+    return {
+        'times' : np.zeros(0, dtype=np.float64),
+        'indices' : np.zeros(0, dtype=np.int32),
+        'offsets' : np.zeros(1, dtype=np.int64),
+        'words' : np.zeros(0, dtype=np.uint8),
+    }
+
+def sort_tuple_columns(columns):
+    '''Returns the columns sorted by time, keeping the order of equal times like sorted(), with words or tokens'''
+    data = 'tokens' if 'tokens' in columns else 'words'
+    order = np.argsort(columns['times'], kind='stable')
+    offsets = columns['offsets']
+    starts = offsets[:-1][order]
+    lengths = offsets[1:][order] - starts
+
+    new_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    # position in the old words buffer of every byte of the new one
+    gather = np.arange(new_offsets[-1], dtype=np.int64) + np.repeat(starts - new_offsets[:-1], lengths)
+    return {
+        'times' : columns['times'][order],
+        'indices' : columns['indices'][order],
+        'offsets' : new_offsets,
+        data : columns[data][gather],
+    }
+
+def save_tuple_columns(columns, file_name):
+    with open(file_name, 'wb') as object_file:
+        np.savez(object_file, **columns)
+
+def load_tuple_columns(file_name):
+    with np.load(file_name) as arrays:
+        return {name : arrays[name] for name in arrays.files}
+
+def columns_yield_tuples(columns):
+    '''Lazily yields the columns as (months, words, index, []) tuples, the shape hdhp expects, or (months, token IDs, index, []) with tokens'''
+    times, indices, offsets = columns['times'], columns['indices'], columns['offsets']
+    if 'tokens' in columns:
+        tokens = columns['tokens']
+        for i in range(len(times)):
+            yield (float(times[i]), array('I', tokens[offsets[i]:offsets[i + 1]].tobytes()), int(indices[i]), [])
+        return
+    words = columns['words']
+    for i in range(len(times)):
+        yield (float(times[i]), words[offsets[i]:offsets[i + 1]].tobytes().decode(), int(indices[i]), [])
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import pickle
+# include these scripts in same directory
+from tuple_sort import LIST_START, LIST_END, list_items
+
+# Default partitions
+MONTHS_PER_SHARD = 1
+ARTICLES_PER_SHARD = 10000
+# Tuples held for a shard before they are appended to its file
+SHARD_BATCH_SIZE = 1000
+MANIFEST_FILE = 'manifest.json'
+
+# A shard directory holds
+#
+#     manifest.json                 partitions, total counts and an entry for every shard file below
+#     time/months-M.pkl             tuples with MONTHS_PER_SHARD * M <= months < MONTHS_PER_SHARD * (M + 1)
+#     articles/articles-A.pkl       tuples with ARTICLES_PER_SHARD * A <= index < ARTICLES_PER_SHARD * (A + 1)
+#     articles/titles-A.json        numbered titles of the same articles, in the same format as the -d file
+#
+# Every .pkl shard is a pickled list of tuples sorted by months, the same as the -t file, so each can be
+# loaded by itself. Shard entries in the manifest hold the file, number of tuples, the range of the
+# partition and the smallest and largest months and article index of the tuples in it.
+
+class ShardEntry:
+    '''Counts and bounds of the tuples written to one shard file'''
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.tuples = 0
+        self.min_months = None
+        self.max_months = None
+        self.min_index = None
+        self.max_index = None
+
+    def add(self, tuples):
+        # tuples arrive sorted by months
+        if self.min_months is None:
+            self.min_months = tuples[0][0]
+            self.min_index = tuples[0][2]
+            self.max_index = tuples[0][2]
+        self.max_months = tuples[-1][0]
+        self.min_index = min(self.min_index, min(tup[2] for tup in tuples))
+        self.max_index = max(self.max_index, max(tup[2] for tup in tuples))
+        self.tuples += len(tuples)
+
+    def to_dict(self):
+        return {
+            'file' : self.file_name,
+            'tuples' : self.tuples,
+            'min_months' : self.min_months,
+            'max_months' : self.max_months,
+            'min_index' : self.min_index,
+            'max_index' : self.max_index,
+        }
+
+class ShardWriter:
+    '''
+    Writes tuples sorted by months into time shards and article shards, with a manifest
+    Pass the sorted tuples through yield_tuples or write_tuples, then call close with the numbered titles
+    '''
+    def __init__(self, shard_dir, min_timestamp, max_timestamp, months_per_shard=MONTHS_PER_SHARD, articles_per_shard=ARTICLES_PER_SHARD):
+        self.shard_dir = shard_dir
+        self.min_timestamp = min_timestamp
+        self.max_timestamp = max_timestamp
+        self.months_per_shard = months_per_shard
+        self.articles_per_shard = articles_per_shard
+        self.time_shards = {} # Time partition -> ShardEntry
+        self.article_shards = {} # Article partition -> ShardEntry
+        self.article_batches = {} # Article partition -> tuples not yet appended
+        self.time_file = None # Time shard being written, tuples are sorted so only one is open
+        self.time_key = None
+        self.time_batch = []
+        os.makedirs(os.path.join(shard_dir, 'time'), exist_ok=True)
+        os.makedirs(os.path.join(shard_dir, 'articles'), exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.shard_dir, name)
+
+    def yield_tuples(self, sorted_tuples):
+        '''Passes tuples sorted by months through, writing each one into its shards'''
+        for tup in sorted_tuples:
+            time_key = int(tup[0] // self.months_per_shard)
+            if time_key != self.time_key:
+                self.finish_time_shard()
+                self.time_key = time_key
+                name = f'time/months-{time_key}.pkl'
+                self.time_shards[time_key] = ShardEntry(name)
+                self.time_file = open(self.path(name), 'wb')
+                self.time_file.write(LIST_START)
+            self.time_batch.append(tup)
+            if len(self.time_batch) == SHARD_BATCH_SIZE:
+                self.flush_time_batch()
+
+            article_key = tup[2] // self.articles_per_shard
+            batch = self.article_batches.setdefault(article_key, [])
+            batch.append(tup)
+            if len(batch) == SHARD_BATCH_SIZE:
+                self.flush_article_batch(article_key)
+            yield tup
+
+    def write_tuples(self, sorted_tuples):
+        for tup in self.yield_tuples(sorted_tuples):
+            pass
+
+    def flush_time_batch(self):
+        if self.time_batch:
+            self.time_shards[self.time_key].add(self.time_batch)
+            self.time_file.write(list_items(self.time_batch))
+            self.time_batch = []
+
+    def finish_time_shard(self):
+        if self.time_file is not None:
+            self.flush_time_batch()
+            self.time_file.write(LIST_END)
+            self.time_file.close()
+            self.time_file = None
+
+    def flush_article_batch(self, article_key):
+        '''Appends the tuples held for one article shard to its file, opening it only for the write'''
+        batch = self.article_batches.pop(article_key)
+        if article_key not in self.article_shards:
+            name = f'articles/articles-{article_key}.pkl'
+            self.article_shards[article_key] = ShardEntry(name)
+            with open(self.path(name), 'wb') as output_file:
+                output_file.write(LIST_START)
+        entry = self.article_shards[article_key]
+        entry.add(batch)
+        with open(self.path(entry.file_name), 'ab') as output_file:
+            output_file.write(list_items(batch))
+
+    def close(self, numbered_titles):
+        '''Finishes every shard, writes the titles of every article shard and the manifest, and returns the manifest'''
+        self.finish_time_shard()
+        for article_key in list(self.article_batches):
+            self.flush_article_batch(article_key)
+        for entry in self.article_shards.values():
+            with open(self.path(entry.file_name), 'ab') as output_file:
+                output_file.write(LIST_END)
+
+        # titles of every article partition, including any without tuples in the window
+        titles = {}
+        for index, entry in numbered_titles.items():
+            titles.setdefault(index // self.articles_per_shard, {})[index] = entry
+        article_entries = []
+        for article_key in sorted(set(titles) | set(self.article_shards)):
+            entry = self.article_shards.get(article_key, ShardEntry(None)).to_dict()
+            entry['titles_file'] = f'articles/titles-{article_key}.json'
+            entry['first_article'] = article_key * self.articles_per_shard
+            entry['end_article'] = (article_key + 1) * self.articles_per_shard
+            entry['articles'] = len(titles.get(article_key, {}))
+            with open(self.path(entry['titles_file']), 'w') as output_file:
+                json.dump(titles.get(article_key, {}), output_file)
+            article_entries.append(entry)
+
+        time_entries = []
+        for time_key in sorted(self.time_shards):
+            entry = self.time_shards[time_key].to_dict()
+            entry['first_month'] = time_key * self.months_per_shard
+            entry['end_month'] = (time_key + 1) * self.months_per_shard
+            time_entries.append(entry)
+
+        manifest = {
+            'min_timestamp' : self.min_timestamp,
+            'max_timestamp' : self.max_timestamp,
+            'months_per_shard' : self.months_per_shard,
+            'articles_per_shard' : self.articles_per_shard,
+            'tuples' : sum(entry['tuples'] for entry in time_entries),
+            'articles' : len(numbered_titles),
+            'time_shards' : time_entries,
+            'article_shards' : article_entries,
+        }
+        with open(self.path(MANIFEST_FILE), 'w') as output_file:
+            json.dump(manifest, output_file, indent=1)
+        return manifest
+
+def read_manifest(shard_dir):
+    with open(os.path.join(shard_dir, MANIFEST_FILE), 'r') as read_file:
+        return json.load(read_file)
+
+def load_shard(shard_dir, entry):
+    '''Returns the list of tuples of a shard entry from the manifest'''
+    if entry['file'] is None:
+        return []
+    with open(os.path.join(shard_dir, entry['file']), 'rb') as read_file:
+        return pickle.load(read_file)
+
+def load_shard_titles(shard_dir, entry):
+    '''Returns the numbered titles of an article shard entry, with integer keys as in the -d file'''
+    with open(os.path.join(shard_dir, entry['titles_file']), 'r') as read_file:
+        return {int(index) : title for index, title in json.load(read_file).items()}
+
+def select_time_shards(manifest, min_months, max_months):
+    '''Returns the time shard entries that can hold tuples with min_months <= months <= max_months'''
+    return [entry for entry in manifest['time_shards'] if entry['max_months'] >= min_months and entry['min_months'] <= max_months]
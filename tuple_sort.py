@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import sys
+import pickle
+import heapq
+import tempfile
+# include these scripts in same directory
+import metrics
+
+# Items pickled together in run files and in the final list
+BATCH_SIZE = 10000
+# Most runs merged at once, more are merged in several passes
+MAX_MERGE_RUNS = 64
+
+def estimate_tuple_size(tup):
+    '''Rough memory, in bytes, taken by one (months, words, index, []) tuple in a list'''
+    return sys.getsizeof(tup) + sys.getsizeof(tup[0]) + sys.getsizeof(tup[1]) + sys.getsizeof(tup[3]) + 8
+
+def dump_run(items, run):
+    '''Pickles items into an open file in batches, to be read back by read_run'''
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            pickle.dump(batch, run, protocol=pickle.HIGHEST_PROTOCOL)
+            batch = []
+    if batch:
+        pickle.dump(batch, run, protocol=pickle.HIGHEST_PROTOCOL)
+
+def write_run(items, tmp_dir=None):
+    '''Pickles items into a temporary file in batches, returns the file rewound to the start'''
+    run = tempfile.TemporaryFile(dir=tmp_dir)
+    dump_run(items, run)
+    run.seek(0)
+    return run
+
+def read_run(run):
+    '''Yields the items of a run file written by write_run or dump_run'''
+    while True:
+        try:
+            batch = pickle.load(run)
+        except EOFError:
+            return
+        yield from batch
+
+def external_sort(items, key, memory_budget, tmp_dir=None, size=estimate_tuple_size):
+    '''
+    Yields items sorted by key, same order as sorted(items, key=key)
+    memory_budget : bytes of items to hold before a sorted run is spilled to a temporary file
+    size : function giving the estimated bytes of one item
+    '''
+    runs = []
+    chunk = []
+    chunk_bytes = 0
+    for item in items:
+        chunk.append(item)
+        chunk_bytes += size(item)
+        if chunk_bytes >= memory_budget:
+            with metrics.stage('sort'):
+                chunk.sort(key=key)
+                runs.append(write_run(chunk, tmp_dir))
+            print(f'Spilled sorted run {len(runs)} of {len(chunk)} items')
+            chunk = []
+            chunk_bytes = 0
+    with metrics.stage('sort'):
+        chunk.sort(key=key)
+
+    # everything fit in memory
+    if not runs:
+        yield from chunk
+        return
+    if chunk:
+        with metrics.stage('sort'):
+            runs.append(write_run(chunk, tmp_dir))
+        chunk = []
+
+    # merge groups of runs until few enough are left, keeping runs in order so equal keys stay stable
+    while len(runs) > MAX_MERGE_RUNS:
+        print(f'Merging {len(runs)} runs...')
+        merged = []
+        for i in range(0, len(runs), MAX_MERGE_RUNS):
+            group = runs[i:i + MAX_MERGE_RUNS]
+            with metrics.stage('sort'):
+                merged.append(write_run(heapq.merge(*[read_run(run) for run in group], key=key), tmp_dir))
+            for run in group:
+                run.close()
+        runs = merged
+
+    print(f'Merging {len(runs)} sorted runs...')
+    try:
+        yield from heapq.merge(*[read_run(run) for run in runs], key=key)
+    finally:
+        for run in runs:
+            run.close()
+
+# Pickle of an empty list, items are appended to it in batches by list_items
+LIST_START = pickle.PROTO + bytes([2]) + pickle.EMPTY_LIST
+LIST_END = pickle.STOP
+
+def list_items(items):
+    '''Returns the pickle opcodes appending items to the list started by LIST_START'''
+    # item pickled on its own, without its protocol header and stop opcode
+    return pickle.MARK + b''.join(pickle.dumps(item, protocol=2)[2:-1] for item in items) + pickle.APPENDS
+
+def save_list_stream(items, file_name):
+    '''
+    Pickles items into file_name as one list, without holding the whole list in memory
+    pickle.load gives back the same list as pickle.dump(list(items))
+    '''
+    with open(file_name, 'wb') as object_file:
+        object_file.write(LIST_START)
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == BATCH_SIZE:
+                object_file.write(list_items(batch))
+                batch = []
+        if batch:
+            object_file.write(list_items(batch))
+        object_file.write(LIST_END)
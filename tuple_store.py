@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import sys
+import mmap
+import struct
+import numpy as np
+
+# Read-only tuple store, sorted tuples laid out so the file can be memory-mapped instead of loaded
+#
+#     MAGIC, uint64 number of tuples, uint64 bytes of words
+#     float64 months of every tuple, sorted
+#     int32 article index of every tuple, padded to 8 bytes
+#     int64 start of the words of every tuple in the words blob, followed by the end of the blob
+#     words blob, utf-8
+#
+# All numbers are little-endian. Opening only maps the file, pages are read as a time window touches them.
+
+MAGIC = b'WIKITUP1'
+STORE_EXTENSION = '.tuples'
+HEADER = struct.Struct('<8sQQ')
+# Tuples decoded at once when iterating
+BATCH_SIZE = 100000
+
+def pad(size):
+    '''Bytes to add after size to reach a multiple of 8'''
+    return -size % 8
+
+def save_tuple_store(columns, file_name):
+    '''Writes columns sorted by time, as returned by tuple_arrays.sort_tuple_columns, into a tuple store file'''
+    times = np.ascontiguousarray(columns['times'], dtype='<f8')
+    indices = np.ascontiguousarray(columns['indices'], dtype='<i4')
+    offsets = np.ascontiguousarray(columns['offsets'], dtype='<i8')
+    words = np.ascontiguousarray(columns['words'], dtype=np.uint8)
+    with open(file_name, 'wb') as output_file:
+        output_file.write(HEADER.pack(MAGIC, len(times), len(words)))
+        output_file.write(times.tobytes())
+        output_file.write(indices.tobytes())
+        output_file.write(bytes(pad(indices.nbytes)))
+        output_file.write(offsets.tobytes())
+        output_file.write(words.tobytes())
+
+class TupleStore:
+    '''
+    Memory-mapped tuple store, use as a context manager
+    times, indices, offsets and words are read-only numpy views of the file, in the same layout as tuple_arrays columns
+    '''
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as read_file:
+            self.map = mmap.mmap(read_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, words_size = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.map.close()
+            print(f'{file_name} is not a tuple store')
+            sys.exit(1)
+        position = HEADER.size
+        self.times = np.frombuffer(self.map, dtype='<f8', count=count, offset=position)
+        position += 8 * count
+        self.indices = np.frombuffer(self.map, dtype='<i4', count=count, offset=position)
+        position += 4 * count + pad(4 * count)
+        self.offsets = np.frombuffer(self.map, dtype='<i8', count=count + 1, offset=position)
+        position += 8 * (count + 1)
+        self.words = np.frombuffer(self.map, dtype=np.uint8, count=words_size, offset=position)
+
+    def __len__(self):
+        return len(self.times)
+
+    def window(self, min_months, max_months):
+        '''Returns (start, end) positions of the tuples with min_months <= months <= max_months'''
+        start = int(np.searchsorted(self.times, min_months, side='left'))
+        end = int(np.searchsorted(self.times, max_months, side='right'))
+        return start, max(start, end)
+
+    def words_of(self, i):
+        return self.words[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+    def __getitem__(self, i):
+        '''The (months, words, index, []) tuple at position i, same as the -t list'''
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('tuple store index out of range')
+        return (float(self.times[i]), self.words_of(i), int(self.indices[i]), [])
+
+    def batch_words(self, start, end):
+        '''Returns the words of the tuples from position start up to end'''
+        offsets = self.offsets[start:end + 1]
+        data = self.words[offsets[0]:offsets[-1]].tobytes()
+        # ascii words can be decoded all at once and cut by their byte offsets
+        if not data.isascii():
+            return [self.words_of(i) for i in range(start, end)]
+        data = data.decode('ascii')
+        ends = (offsets - offsets[0]).tolist()
+        return [data[ends[i]:ends[i + 1]] for i in range(end - start)]
+
+    def yield_tuples(self, start=0, end=None):
+        '''Yields the (months, words, index, []) tuples from position start up to end'''
+        end = len(self) if end is None else end
+        for batch_start in range(start, end, BATCH_SIZE):
+            batch_end = min(batch_start + BATCH_SIZE, end)
+            words = self.batch_words(batch_start, batch_end)
+            yield from zip(self.times[batch_start:batch_end].tolist(), words, self.indices[batch_start:batch_end].tolist(), ([] for _ in words))
+
+    def __iter__(self):
+        return self.yield_tuples()
+
+    def time_window(self, min_months, max_months):
+        '''Returns the list of tuples with min_months <= months <= max_months'''
+        return list(self.yield_tuples(*self.window(min_months, max_months)))
+
+    def close(self):
+        # views have to go before the map can close
+        del self.times, self.indices, self.offsets, self.words
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
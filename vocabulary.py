@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+from array import array
+from collections import Counter
+
+# Vocabulary file, one token per line in ID order
+#
+#     ID <tab> token <tab> frequency
+#
+# Tokens are words from convert_to_words, which never hold whitespace.
+
+class TokenIds(dict):
+    '''Dictionary of token -> ID that gives a missing token the next ID'''
+    def __missing__(self, token):
+        token_id = len(self)
+        self[token] = token_id
+        return token_id
+
+class Vocabulary:
+    '''
+    Interns the words of edits, giving every token a stable integer ID in order of first appearance
+    frequencies counts how often every token was encoded
+    '''
+    def __init__(self):
+        self.ids = TokenIds()
+        self.frequencies = Counter()
+
+    def encode(self, words):
+        '''Returns the IDs of a space separated words string as an array of unsigned ints'''
+        tokens = words.split()
+        self.frequencies.update(tokens)
+        return array('I', map(self.ids.__getitem__, tokens))
+
+    def tokens(self):
+        '''Returns the list of tokens, the token of ID i at position i'''
+        tokens = [None] * len(self.ids)
+        for token, token_id in self.ids.items():
+            tokens[token_id] = token
+        return tokens
+
+    def decode(self, token_ids, tokens=None):
+        '''Returns the words string of an array of IDs, pass tokens() to decode many'''
+        if tokens is None:
+            tokens = self.tokens()
+        return ' '.join(tokens[token_id] for token_id in token_ids)
+
+    def lines(self):
+        '''Yields the lines of the vocabulary file'''
+        for token_id, token in enumerate(self.tokens()):
+            yield f'{token_id}\t{token}\t{self.frequencies[token]}\n'
+
+    def save(self, file_name):
+        with open(file_name, 'w') as output_file:
+            output_file.writelines(self.lines())
+
+    def load(self, file_name, frequencies=True):
+        '''Adds the tokens of a vocabulary file with their IDs, and their frequencies unless frequencies is False'''
+        with open(file_name, 'r') as read_file:
+            for line in read_file:
+                token_id, token, frequency = line.rstrip('\n').split('\t')
+                if int(token_id) != len(self.ids):
+                    raise ValueError(f'{file_name} does not list IDs in order at {token}')
+                self.ids[token] = int(token_id)
+                if frequencies:
+                    self.frequencies[token] = int(frequency)
+
+def load_vocabulary(file_name, frequencies=True):
+    vocabulary = Vocabulary()
+    vocabulary.load(file_name, frequencies)
+    return vocabulary
+
+def open_vocabulary(file_name):
+    '''Returns a vocabulary keeping the IDs of file_name if it exists, so outputs of several runs share IDs, with frequencies counted anew'''
+    if os.path.exists(file_name):
+        return load_vocabulary(file_name, frequencies=False)
+    return Vocabulary()
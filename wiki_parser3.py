@@ -3,10 +3,16 @@
 import os
 import sys
 import json
+import html
+import itertools
 import urllib.parse as urllib
 from html.parser import HTMLParser
+from functools import lru_cache
 from bs4 import BeautifulSoup
 import re
+# include these scripts in same directory
+import metrics
+from article_index import ArticleIndex
 
 def usage(status=0):
     ''' Display usage information and exit with specified status '''
@@ -40,8 +46,7 @@ def basic_parse_make_numbered_titles_file(data, file_name, min_timestamp, max_ti
     prev = None
     curr = next(data, None)
     next_tup = next(data, None)
-    index = -1
-    prev_index = index
+    article_index = ArticleIndex()
     total_tuples = 0
     tuples_of_title = 0
     title = next_tup[1]
@@ -65,8 +70,8 @@ def basic_parse_make_numbered_titles_file(data, file_name, min_timestamp, max_ti
             except ValueError:
                 # is a title
                 # add prev title to dictionary if has tuples
-                if index != prev_index:
-                    titles_dict[index] = {title : {'total_timestamps' : num_timestamps, 'usable_timestamps' : tuples_of_title}}
+                if tuples_of_title > 0:
+                    titles_dict[article_index.assign(title)] = {title : {'total_timestamps' : num_timestamps, 'usable_timestamps' : tuples_of_title}}
                 title = curr[1]
                 tuples_of_title = 0
             else:
@@ -86,14 +91,14 @@ def basic_parse_make_numbered_titles_file(data, file_name, min_timestamp, max_ti
                     if len(words) > 0:
                         tuples_of_title += 1
                         total_tuples += 1
-                        # increment index
-                        if tuples_of_title == 1:
-                            index += 1
 
         #increment
         prev = curr
         curr = next_tup
         next_tup = next(data, None)
+    # add last title
+    if tuples_of_title > 0:
+        titles_dict[article_index.assign(title)] = {title : {'total_timestamps' : num_timestamps, 'usable_timestamps' : tuples_of_title}}
     
     print(f'Writing dictionary to {file_name}')
     with open(file_name, 'w') as output_file:
@@ -107,36 +112,10 @@ def dict_make_numbered_titles_file(data, file_name, min_timestamp, max_timestamp
     file_name : name of file to save into
     min_timestamp and max_timestamp : range of times, in seconds, to save file. Should be same as range of yield tuples function
     '''
-    # initialize title index, dictionary
-    index = 0
+    # titles are numbered while making their tuples, so the numbers are the same
     numbered_titles = {}
-    
-    for title in data:
-        # get number of timestamps
-        num_timestamps = data[title].get('number of ts')
-        usable_timestamps = 0
-
-        # loop through dictionary and create tuples
-        for timestamp in data[title]:
-            # skip number of ts entry
-            if (timestamp == 'number of ts'):
-                continue
-            words = ''
-            # collect timestamps within the time period
-            if float(timestamp) > min_timestamp and float(timestamp) < max_timestamp:
-                # get removed words
-                for removed_string in data[title][timestamp]['Removed']:
-                    words += convert_to_words(removed_string) + ' '
-                # get added words
-                for added_string in data[title][timestamp]['Added']:
-                    words += convert_to_words(added_string) + ' '
-                # check if there are words in edit
-                if len(words) > 0:
-                    usable_timestamps += 1
-        # increment index and add to dictionary
-        if usable_timestamps > 0:
-            numbered_titles[index] = {title : {'total_timestamps' : num_timestamps, 'usable_timestamps' : usable_timestamps}}
-            index += 1
+    for tup in stream_yield_tuples(data.items(), min_timestamp, max_timestamp, numbered_titles):
+        pass
 
     # write the dictionary to a new file
     with open(file_name, 'w') as output_file:
@@ -149,14 +128,62 @@ def convert_secs_to_days(seconds):
 def convert_secs_to_months(seconds):
     return seconds/2629800.0
 
-def convert_to_words(input_string):
-    '''Will take in an string with html or url and get the usable words out of it'''
+# Default number of strings remembered by convert_to_words
+WORD_CACHE_SIZE = 2 ** 20
 
-    # decode url
-    new_string = urllib.unquote(input_string)
+# Words dropped from every string, checked before lower casing
+BLOCKED_WORDS = frozenset(('com', 'png', 'jpeg', 'gov', 'org', 'io', 'http', 'https'))
+WORD_PATTERN = re.compile(r'\w+')
+# A start or end tag strip_tags would take whole, holding no quotes or brackets it could read another way
+TAG_PATTERN = re.compile(r'''<(?:/([a-zA-Z][a-zA-Z0-9]*)\s*|([a-zA-Z][a-zA-Z0-9]*)(?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*(?:\s*=\s*(?:"[^"<>]*"|'[^'<>]*'|[^\s"'<>=`]+))?)*\s*/?)>''')
+# Tags whose text HTMLParser reads raw, such strings go through strip_tags
+RAW_TEXT_TAGS = frozenset(('script', 'style', 'textarea', 'title', 'xmp', 'iframe', 'noembed', 'noframes', 'noscript', 'plaintext'))
+CHARREF_END = re.compile(r'[\s;]')
 
-    # strip the html
-    new_string = strip_tags(new_string)
+def strip_markup(text):
+    '''
+    Same as strip_tags, with the tags taken out by one regex scan
+    Strings with comments, declarations, raw text tags or a < outside a simple tag go through strip_tags
+    '''
+    parts = TAG_PATTERN.split(text) if '<' in text else [text]
+    segments = parts[::3]
+    for name in itertools.chain(parts[1::3], parts[2::3]):
+        if name and name.lower() in RAW_TEXT_TAGS:
+            return strip_tags(text)
+    if any('<' in segment for segment in segments):
+        return strip_tags(text)
+    # like HTMLParser without close, text after the last tag is held back while it may end in a cut off charref
+    last = segments[-1]
+    amp = last.rfind('&', max(0, len(last) - 34))
+    if amp >= 0 and not CHARREF_END.search(last, amp):
+        segments[-1] = ''
+    return ''.join(html.unescape(segment) if '&' in segment else segment for segment in segments)
+
+def convert_to_words_uncached(input_string):
+    '''Will take in an string with html or url and get the usable words out of it, the same as convert_to_words_stripper'''
+    if input_string.isalnum():
+        # a single word, \w is the same as isalnum
+        return '' if input_string in BLOCKED_WORDS else input_string.lower()
+    # decode url and strip html only if the string could have any
+    if '%' in input_string:
+        input_string = urllib.unquote(input_string)
+    if '<' in input_string or '&' in input_string:
+        input_string = strip_markup(input_string)
+    # lower casing the joined words gives the same as lower casing each
+    return ' '.join([word for word in WORD_PATTERN.findall(input_string) if word not in BLOCKED_WORDS]).lower()
+
+def convert_to_words_stripper(input_string):
+    '''The first convert_to_words, with HTMLParser for every string holding html or url, to check convert_to_words_uncached against'''
+
+    # Only decode url and strip html if the string could have any
+    if '%' in input_string or '<' in input_string or '&' in input_string:
+        # decode url
+        new_string = urllib.unquote(input_string)
+
+        # strip the html
+        new_string = strip_tags(new_string)
+    else:
+        new_string = input_string
 
     # Split with regex to find alphabetic words
     words_in_string = re.findall(r'\w+', new_string)
@@ -174,6 +201,18 @@ def convert_to_words(input_string):
 
     return words.strip()
 
+# The same strings repeat across millions of revisions, so remember the most recent ones
+convert_to_words = lru_cache(maxsize=WORD_CACHE_SIZE)(convert_to_words_uncached)
+
+def set_word_cache_size(maxsize):
+    '''Replaces the convert_to_words cache with one holding maxsize strings, 0 turns caching off'''
+    global convert_to_words
+    convert_to_words = lru_cache(maxsize=maxsize)(convert_to_words_uncached)
+
+def word_cache_info():
+    '''Returns hits, misses, maxsize and currsize of the convert_to_words cache'''
+    return convert_to_words.cache_info()
+
 def dict_yield_tuples(data, min_timestamp, max_timestamp):
     '''
     Pass data as a dict object
@@ -182,46 +221,72 @@ def dict_yield_tuples(data, min_timestamp, max_timestamp):
     Words in edit come from removed and added words
     
     '''
-
+    yield from stream_yield_tuples(data.items(), min_timestamp, max_timestamp)
+
+def page_edits(title_dict, min_timestamp, max_timestamp):
+    '''Returns list of (timestamp in seconds, words) of every edit of a title dictionary that would make a tuple'''
+    edits = []
+    for timestamp in title_dict:
+        # skip number of ts entry
+        if (timestamp == 'number of ts'):
+            continue
+        # collect timestamps within the time period
+        if float(timestamp) > min_timestamp and float(timestamp) < max_timestamp:
+            words = edit_words(title_dict[timestamp])
+            # check if there are words in edit
+            if len(words) > 0:
+                edits.append((float(timestamp), words.rstrip()))
+    return edits
+
+def edit_words(edit):
+    '''Returns the converted removed words then added words of one timestamp entry, each followed by a space'''
+    words = ''
+    # get removed words
+    for removed_string in edit['Removed']:
+        words += convert_to_words(removed_string) + ' '
+    # get added words
+    for added_string in edit['Added']:
+        words += convert_to_words(added_string) + ' '
+    return words
+
+def stream_yield_tuples(pages, min_timestamp, max_timestamp, numbered_titles=None, on_page=None, article_index=None, edits_of=None):
+    '''
+    Pass pages as an iterable of (title, title dictionary), such as xml_parse.parse_pages
+    Yields the same tuples as dict_yield_tuples without needing the whole dictionary in memory
+    numbered_titles : optional dictionary, filled in the same format as dict_make_numbered_titles_file
+    on_page : optional function called with (index, title, title dictionary, edits) of every title with tuples,
+              edits as returned by page_edits, so other outputs can share the same pass
+    article_index : optional article_index.ArticleIndex numbering the titles with tuples, to carry on after titles already
+                    numbered or keep the numbers of an earlier run. By default they are numbered from 0 in order
+    edits_of : optional function returning the same as page_edits, such as one handing back edits already found elsewhere
+    '''
     # initialize title index
-    index = 0
+    if article_index is None:
+        article_index = ArticleIndex()
+    if edits_of is None:
+        edits_of = metrics.timed_function(page_edits, 'normalize')
     loading_signal = 0
     total_tuples = 0
-    
-    for title in data:
+
+    for title, title_dict in pages:
         # show loading signal
         loading_signal += 1
         if loading_signal == 10000000:
-            print(f'Loading, on title {index}, with {total_tuples} total tuples')
+            print(f'Loading, on title {article_index.next_index}, with {total_tuples} total tuples')
             loading_signal = 0
-        
-        # set num tuples created
-        tuples_of_title = 0
-
-        # loop through dictionary and create tuples
-        for timestamp in data[title]:
-            # skip number of ts entry
-            if (timestamp == 'number of ts'):
-                continue
-            words = ''
-            # collect timestamps within the time period
-            if float(timestamp) > min_timestamp and float(timestamp) < max_timestamp:
-                # get removed words
-                for removed_string in data[title][timestamp]['Removed']:
-                    words += convert_to_words(removed_string) + ' '
-                # get added words
-                for added_string in data[title][timestamp]['Added']:
-                    words += convert_to_words(added_string) + ' '
-                # check if there are words in edit
-                if len(words) > 0:
-                    # create tuple
-                    tuple1 = (convert_secs_to_months(float(timestamp)-min_timestamp), words.rstrip(), index, [])
-                    tuples_of_title += 1
-                    total_tuples += 1
-                    yield tuple1
-        # increment index
-        if tuples_of_title > 0:
-            index += 1
+
+        edits = edits_of(title_dict, min_timestamp, max_timestamp)
+        if len(edits) == 0:
+            continue
+        index = article_index.assign_page(title)
+        for seconds, words in edits:
+            total_tuples += 1
+            yield (convert_secs_to_months(seconds-min_timestamp), words, index, [])
+        # add to dictionary
+        if numbered_titles is not None:
+            numbered_titles[index] = {title : {'total_timestamps' : title_dict.get('number of ts'), 'usable_timestamps' : len(edits)}}
+        if on_page is not None:
+            on_page(index, title, title_dict, edits)
 
 def basic_parse_yield_tuples(data, min_timestamp, max_timestamp):
     ''' Data passed in as ijson basic parse object'''
@@ -230,7 +295,7 @@ def basic_parse_yield_tuples(data, min_timestamp, max_timestamp):
     prev = None
     curr = next(data, None)
     next_tup = next(data, None)
-    index = -1
+    article_index = ArticleIndex()
     total_tuples = 0
     tuples_of_title = 0
     title = next_tup[1]
@@ -270,9 +335,9 @@ def basic_parse_yield_tuples(data, min_timestamp, max_timestamp):
                     if len(words) > 0:
                         tuples_of_title += 1
                         total_tuples += 1
-                        # increment index
+                        # number title with its first tuple
                         if tuples_of_title == 1:
-                            index += 1
+                            index = article_index.assign(title)
                         # create tuple
                         tuple1 = (convert_secs_to_months(timestamp-min_timestamp), words.rstrip(), index, [])
                         yield tuple1
@@ -291,40 +356,7 @@ def yield_tuples(data, min_timestamp, max_timestamp):
     Words in edit come from removed and added words
     
     '''
-
-    # initialize title index, dictionary, list
-    index = 0
-    total_tuples = 0
-
-    for title_tuple in data:
-        # set num tuples created
-        tuples_of_title = 0
-        title_dict = title_tuple[1]
-
-        # loop through dictionary and create tuples
-        for timestamp in title_dict:
-            # skip number of ts entry
-            if (timestamp == 'number of ts'):
-                continue
-            words = ''
-            # collect timestamps within the time period
-            if float(timestamp) > min_timestamp and float(timestamp) < max_timestamp:
-                # get removed words
-                for removed_string in title_dict[timestamp]['Removed']:
-                    words += convert_to_words(removed_string) + ' '
-                # get added words
-                for added_string in title_dict[timestamp]['Added']:
-                    words += convert_to_words(added_string) + ' '
-                # check if there are words in edit
-                if len(words) > 0:
-                    # create tuple
-                    tuple1 = (convert_secs_to_months(float(timestamp)-min_timestamp), words.rstrip(), index, [])
-                    tuples_of_title += 1
-                    total_tuples += 1
-                    yield tuple1
-        # increment index
-        if tuples_of_title > 0:
-            index += 1
+    yield from stream_yield_tuples(data, min_timestamp, max_timestamp)
 
 def parse_data(data_file, tuples_file, numbered_titles_file):
 
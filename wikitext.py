@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import re
+
+# Wikitext cleaning of revision text before it is split into words (parse_wiki.py -W)
+#
+#     {{templates}}, {| tables |}, <ref>refs</ref>, <ref name=x /> and <!-- comments -->    dropped whole
+#     [[File:...]], [[Image:...]], [[Category:...]] and their Indonesian names                dropped whole
+#     [[target|display]]                                                                     display
+#     [[target]]                                                                             target
+#
+# Markup is found by one regex scan, looking for a | only in the target of a link. Every construct opened is a
+# frame on a stack, its text goes into the output and is dropped or cut down when it closes, so text with an
+# unclosed construct keeps it as written. A closer ends the nearest frame of its kind along with any unclosed
+# frames inside it, and is kept as text if there is none. The namespace of a link is read where it opens, from
+# at most NAMESPACE_LENGTH characters up to a :, and a closing link takes out its target by blanking it or by
+# moving its display text over it, whichever has fewer pieces of output. A piece is only on the smaller side of
+# links that are at least twice as big every time, so nested links add at most a log factor to the time taken.
+#
+# The pull engine gives text with its entities unescaped, the lines engine as escaped in the dump, so tags are
+# matched in both forms.
+
+# Tables start on a new line
+MARKUP_PATTERN = r'''
+      (?P<template_open>\{\{)
+    | (?P<template_close>\}\})
+    | (?P<link_open>\[\[)
+    | (?P<link_close>\]\])
+    | (?P<table_open>\n[ \t]*\{\|)
+    | (?P<table_close>\n[ \t]*\|\})
+    | (?P<ref_open>(?:<|&lt;)[Rr][Ee][Ff](?=[\s/>&])[^\n]{0,500}?(?P<self_closing>/)?(?:>|&gt;))
+    | (?P<ref_close>(?:<|&lt;)/[Rr][Ee][Ff]\s*(?:>|&gt;))
+    | (?P<comment>(?:<|&lt;)!--)
+'''
+# The lookahead of the first characters lets the scan skip all others quickly
+MARKUP = re.compile(r'(?=[{}\[\]<&\n])(?:' + MARKUP_PATTERN + ')', re.VERBOSE)
+# In the target of a link its first | is looked for too, it is the only place a | is wanted
+TARGET_MARKUP = re.compile(r'(?=[{}\[\]<&\n|])(?:' + MARKUP_PATTERN + r'| (?P<pipe>\|))', re.VERBOSE)
+# (kind, open or close) of every group number, pipe is only in TARGET_MARKUP
+MARKUP_GROUPS = {index : name.partition('_')[::2] for name, index in TARGET_MARKUP.groupindex.items()}
+COMMENT_END = re.compile(r'--(?:>|&gt;)')
+# Longest text before the : of a link that is still looked up as a namespace, names and the spaces around them
+NAMESPACE_LENGTH = 64
+LINK_NAMESPACE = re.compile(r'[^:|\[\]{}<]{0,%d}:' % NAMESPACE_LENGTH)
+
+# Link namespaces whose links are not text, in lower case
+DROPPED_NAMESPACES = frozenset(('file', 'image', 'media', 'category', 'berkas', 'gambar', 'kategori'))
+
+def has_markup(text):
+    '''Whether text could hold anything clean_wikitext takes out'''
+    return '{' in text or '[' in text or '<' in text or '&lt;' in text
+
+def clean_wikitext(text):
+    '''Returns text with templates, tables, refs, comments, file and category links taken out, and links replaced by their display text'''
+    if not has_markup(text):
+        return text
+    # a table can start on the first line too
+    text = '\n' + text
+    output = []
+    append = output.append
+    frames = [] # [kind, index of its opener in output, index of its first | in output or None, whether it is a dropped link]
+    open_count = {'template' : 0, 'link' : 0, 'table' : 0, 'ref' : 0}
+    search = MARKUP.search
+    position = 0
+    while True:
+        match = search(text, position)
+        if match is None:
+            break
+        start = match.start()
+        if start > position:
+            append(text[position:start])
+        position = match.end()
+        kind, side = MARKUP_GROUPS[match.lastindex]
+
+        if kind == 'comment':
+            end = COMMENT_END.search(text, position)
+            position = end.end() if end else len(text)
+            continue
+        if kind == 'pipe':
+            frames[-1][2] = len(output)
+            append('|')
+        elif side == 'open':
+            if kind == 'ref' and match.group('self_closing'):
+                continue
+            opener = match.group()
+            if kind == 'table':
+                # the line break is not part of the table
+                append('\n')
+                opener = opener[1:]
+            dropped = False
+            if kind == 'link':
+                namespace = LINK_NAMESPACE.match(text, position)
+                dropped = namespace is not None and namespace.group()[:-1].strip().lower() in DROPPED_NAMESPACES
+            frames.append([kind, len(output), None, dropped])
+            open_count[kind] += 1
+            append(opener)
+        elif open_count[kind] == 0:
+            # nothing to close, keep it as text
+            append(match.group())
+        else:
+            # close the nearest frame of this kind, and unclosed ones inside it
+            while True:
+                frame = frames.pop()
+                open_count[frame[0]] -= 1
+                if frame[0] == kind:
+                    break
+            opener, pipe, dropped = frame[1:]
+            if kind != 'link' or dropped:
+                del output[opener:]
+            elif pipe is None:
+                output[opener] = ''
+            elif pipe - opener < len(output) - pipe:
+                # blank the target or move the display text over it, whichever has fewer pieces
+                for index in range(opener, pipe + 1):
+                    output[index] = ''
+            else:
+                del output[opener:pipe + 1]
+        # the first | of a link target is only looked for while it is the innermost frame
+        search = TARGET_MARKUP.search if frames and frames[-1][0] == 'link' and frames[-1][2] is None else MARKUP.search
+    append(text[position:])
+    return ''.join(output)[1:]
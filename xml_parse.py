@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 
-import difflib
 import sys
+import os
 import bz2
-import gzip
-import time
 import json
 import xml.etree.ElementTree as ET
 import datetime
+import calendar
+import html
+import re
+import itertools
 import dateutil.parser as dp
+from collections import deque, namedtuple
+from functools import partial, lru_cache
+from multiprocessing import Pool
+# include these scripts in same directory
+import metrics
+import decompress
+import token_diff
+from page_state import PageStates
+from wikitext import clean_wikitext
 
 def usage(status=0):
     ''' Display usage information and exit with specified status '''
@@ -22,33 +33,362 @@ def usage(status=0):
 
 def bz2_generate_lines(data_file):
         
-        with bz2.open(data_file, "rb") as f:
-                for line in f:
-                        yield line
+        yield from decompress.generate_lines(data_file, 'bz2')
 
 def gzip_generate_lines(data_file):
         
-        with gzip.open(data_file, "rb") as f:
+        yield from decompress.generate_lines(data_file, 'gz')
+
+class PageFilter:
+        '''
+        Chooses which pages get parsed, pages failing any of the given conditions are skipped
+        namespaces : set of namespace numbers to keep
+        titles : set of titles to keep
+        title_regex : pattern a title must match from the start
+        '''
+        def __init__(self, namespaces=None, titles=None, title_regex=None):
+                self.namespaces = set(namespaces) if namespaces is not None else None
+                self.titles = set(titles) if titles is not None else None
+                self.title_regex = re.compile(title_regex) if title_regex else None
+
+        def has_title_filter(self):
+                return self.titles is not None or self.title_regex is not None
+
+        def matches_title(self, title):
+                if self.titles is not None and title not in self.titles:
+                        return False
+                if self.title_regex is not None and not self.title_regex.match(title):
+                        return False
+                return True
+
+        def __call__(self, title, ns):
+                if self.namespaces is not None and ns not in self.namespaces:
+                        return False
+                return self.matches_title(title)
+
+def load_titles(titles_file):
+        '''Returns set of titles in a file with one title per line'''
+        with open(titles_file, 'r') as read_file:
+                return set(line.strip() for line in read_file if line.strip())
+
+def read_multistream_index(index_file):
+        '''
+        Reads a multistream index, lines in format offset:pageID:title, and returns the sorted byte offsets of every bz2 stream
+        Index can be the .txt.bz2 file from wikimedia or already unzipped
+        '''
+        offsets = set()
+        opener = bz2.open if index_file.endswith('.bz2') else open
+        with opener(index_file, 'rb') as f:
                 for line in f:
-                        yield line
+                        offset = line.split(b':', 1)[0]
+                        if offset.strip():
+                                offsets.add(int(offset))
+        return sorted(offsets)
 
-def parse_file(data_file, file_type):
+def select_multistream_offsets(index_file, page_filter):
+        '''Returns set of byte offsets of the bz2 streams holding at least one title matching page_filter'''
+        selected = set()
+        opener = bz2.open if index_file.endswith('.bz2') else open
+        with opener(index_file, 'rb') as f:
+                for line in f:
+                        parts = line.rstrip(b'\r\n').split(b':', 2)
+                        if len(parts) == 3 and page_filter.matches_title(html.unescape(parts[2].decode())):
+                                selected.add(int(parts[0]))
+        return selected
+
+def multistream_blocks(data_file, offsets, selected=None):
+        '''
+        Yields (start, end) byte range of every bz2 stream in the multistream data file, including header and footer
+        selected : optional set of stream offsets, only those streams are yielded
+        '''
+        file_size = os.path.getsize(data_file)
+        bounds = sorted(set([0] + [offset for offset in offsets if offset < file_size])) + [file_size]
+        for start, end in zip(bounds, bounds[1:]):
+                if selected is None or start in selected:
+                        yield start, end
+
+def parse_block(args):
+        '''Worker for parse_multistream_pages, decompresses one byte range and returns its list of (title, page)'''
+        data_file, start, end, engine, window, page_filter, diff, states, page_ids, wikitext = args
+        with open(data_file, 'rb') as f:
+                f.seek(start)
+                raw = f.read(end - start)
+        data = bz2.decompress(raw)
+        if engine == 'pull':
+                if b'<page>' not in data:
+                        return []
+                # page groups have no root element, give them one (never closed, so the footer is not needed)
+                if not data.lstrip().startswith(b'<mediawiki'):
+                        data = b'<mediawiki>' + data
+        return list(PARSE_ENGINES[engine](data.splitlines(keepends=True), window, page_filter, diff, states, page_ids, wikitext))
+
+def parse_multistream_blocks(data_file, index_file, processes=None, engine='lines', window=None, page_filter=None, first_block=0, diff='set', states=None, page_ids=False, wikitext=False):
+        '''
+        Parses the bz2 streams of a multistream dump over a process pool
+        Yields (start offset, list of (title, page dictionary)) of every stream in file order
+        With a title filter, only streams holding a matching title in the index are read
+        first_block : streams starting before this byte offset are skipped
+        '''
+        selected = None
+        if page_filter is not None and page_filter.has_title_filter():
+                selected = select_multistream_offsets(index_file, page_filter)
+        blocks = multistream_blocks(data_file, read_multistream_index(index_file), selected)
+        processes = processes or os.cpu_count() or 1
+        with Pool(processes) as pool:
+                # keep a bounded window of blocks in flight, collecting them in order
+                max_pending = 2 * processes
+                pending = deque()
+                for start, end in blocks:
+                        if start < first_block:
+                                continue
+                        pending.append((start, end, pool.apply_async(parse_block, ((data_file, start, end, engine, window, page_filter, diff, states, page_ids, wikitext),))))
+                        if len(pending) >= max_pending:
+                                yield collect_block(pending.popleft())
+                while pending:
+                        yield collect_block(pending.popleft())
+
+def collect_block(pending_block):
+        '''Waits for a block sent to parse_block and returns (start offset, list of (title, page dictionary))'''
+        start, end, result = pending_block
+        if metrics.METRICS is not None:
+                # workers keep their own timings, only the bytes they were given are known here
+                metrics.METRICS.count('compressed_bytes', end - start)
+        return start, result.get()
+
+def parse_multistream_pages(data_file, index_file, processes=None, engine='lines', window=None, page_filter=None, diff='set', states=None, page_ids=False, wikitext=False):
+        '''
+        Parses the bz2 streams of a multistream dump over a process pool
+        Yields (title, page dictionary) in file order, same as parse_pages
+        '''
+        for start, pages in parse_multistream_blocks(data_file, index_file, processes, engine, window, page_filter, diff=diff, states=states, page_ids=page_ids, wikitext=wikitext):
+                yield from pages
+
+def parse_file(data_file, file_type, index_file=None, processes=None, engine='lines', window=None, page_filter=None, diff='set', states=None, page_ids=False, wikitext=False):
         '''
         Function will read through zipped xml file and return dictionary of titles and timestamps
         File type is bz2 or gz
+        index_file : optional multistream index, bz2 streams are then parsed in parallel
+        engine : name of the parser in PARSE_ENGINES, lines or pull
+        window : optional (min_timestamp, max_timestamp), revisions outside it are counted in number of ts but not stored
+        page_filter : optional PageFilter, other pages are skipped without reading their revisions
+        diff : name of the DIFF_MODES, set (default) keeps words added or removed, counts also how many times, spans the runs of words in place
+        states : optional page state file of earlier runs, or its PageStates, revisions up to the last one it has of a page are counted but not stored.
+                 Every page then gets a 'state' of (last revision ID, epoch seconds, words) for page_state.PageStateWriter
+        page_ids : give every page its 'page id', for article_index.ArticleIndex, needed with states
+        wikitext : clean templates, tables, refs and links out of every revision before diffing, see wikitext.clean_wikitext
         '''
-        if file_type == 'bz2':
-                records_stream = bz2_generate_lines(data_file)
-        elif file_type == 'gz':
-                records_stream = gzip_generate_lines(data_file)
-        else:
+        store = {}
+        for title, page in parse_pages(data_file, file_type, index_file, processes, engine, window, page_filter, diff, states, page_ids, wikitext):
+                store[title] = page
+        return store
+
+def parse_pages(data_file, file_type, index_file=None, processes=None, engine='lines', window=None, page_filter=None, diff='set', states=None, page_ids=False, wikitext=False):
+        '''
+        Generator version of parse_file, yields (title, page dictionary) as each </page> closes
+        Only one article is held in memory at a time
+        '''
+        if engine not in PARSE_ENGINES:
+                print(f'Incorrect parser engine {engine}')
+                sys.exit(1)
+        if diff not in DIFF_MODES:
+                print(f'Incorrect diff mode {diff}')
+                sys.exit(1)
+        if file_type == 'bz2' and index_file:
+                return parse_multistream_pages(data_file, index_file, processes, engine, window, page_filter, diff, states, page_ids, wikitext)
+        elif file_type not in ('bz2', 'gz'):
                 print('Incorrect file type')
                 sys.exit(1)
-        store = {}
+        records_stream = decompress.generate_lines(data_file, file_type)
+        return parse_stream(records_stream, engine, window, page_filter, diff, states, page_ids, wikitext)
+
+def parse_stream(records_stream, engine, window, page_filter, diff, states, page_ids, wikitext):
+        '''Parses records_stream with the engine in this process, the page states of a state file name are only open while it parses'''
+        page_states = PageStates(states) if isinstance(states, str) else states
+        try:
+                yield from PARSE_ENGINES[engine](records_stream, window, page_filter, diff, page_states, page_ids, wikitext)
+        finally:
+                if page_states is not states:
+                        page_states.close()
+
+def count_lines(records_stream, counter):
+        '''Passes records through, adding one to counter[0] for each'''
+        for record in records_stream:
+                counter[0] += 1
+                yield record
+
+def parse_positioned_pages(data_file, file_type, index_file=None, processes=None, engine='lines', window=None, page_filter=None, resume=None, diff='set', states=None, page_ids=False, wikitext=False):
+        '''
+        Same as parse_pages, but yields (title, page dictionary, position) as each </page> closes
+        position is a json-able dictionary, passing it back as resume carries on with the page after that one
+        It also holds 'compressed', the bytes of the data file read so far
+        resume : optional position yielded with an earlier page of the same file and options
+        '''
+        if engine not in PARSE_ENGINES:
+                print(f'Incorrect parser engine {engine}')
+                sys.exit(1)
+        if diff not in DIFF_MODES:
+                print(f'Incorrect diff mode {diff}')
+                sys.exit(1)
+        if file_type == 'bz2' and index_file:
+                # a stream is the smallest part that can be decompressed on its own, so resume at its start and skip the pages already done
+                first_block = resume['block'] if resume else 0
+                for start, pages in parse_multistream_blocks(data_file, index_file, processes, engine, window, page_filter, first_block, diff, states, page_ids, wikitext):
+                        done = resume['page'] if resume and start == resume['block'] else 0
+                        for number, (title, page) in enumerate(pages[done:], done + 1):
+                                yield title, page, {'block' : start, 'page' : number, 'compressed' : start}
+                return
+        elif file_type not in ('bz2', 'gz'):
+                print('Incorrect file type')
+                sys.exit(1)
+
+        lines_done = resume['lines'] if resume else 0
+        with decompress.open_decompressed(data_file, file_type) as (raw, f):
+                lines = decompress.chunk_lines(f, raw)
+                # single streams can not be entered in the middle, decompress past the lines already parsed without looking at them
+                deque(itertools.islice(lines, lines_done), maxlen=0)
+                counter = [lines_done]
+                records_stream = count_lines(lines, counter)
+                if engine == 'pull' and lines_done:
+                        # the rest of the pages need a root element
+                        records_stream = itertools.chain([b'<mediawiki>\n'], records_stream)
+                for title, page in parse_stream(records_stream, engine, window, page_filter, diff, states, page_ids, wikitext):
+                        yield title, page, {'lines' : counter[0], 'compressed' : raw.tell()}
+
+# Epoch seconds of every day seen by parse_timestamp
+DAY_SECONDS = {}
+
+def parse_timestamp(zulu):
+        '''
+        Returns integer epoch seconds, in UTC, of a wikimedia timestamp
+        Timestamps are always YYYY-MM-DDTHH:MM:SSZ, anything else goes to dateutil
+        '''
+        if len(zulu) == 20 and zulu[10] == 'T' and zulu[19] == 'Z' and zulu[13] == ':' and zulu[16] == ':':
+                day = zulu[:10]
+                day_seconds = DAY_SECONDS.get(day)
+                try:
+                        if day_seconds is None:
+                                date = datetime.date(int(zulu[:4]), int(zulu[5:7]), int(zulu[8:10]))
+                                day_seconds = calendar.timegm(date.timetuple())
+                                DAY_SECONDS[day] = day_seconds
+                        hours, minutes, seconds = int(zulu[11:13]), int(zulu[14:16]), int(zulu[17:19])
+                        if hours < 24 and minutes < 60 and seconds < 60:
+                                return day_seconds + hours * 3600 + minutes * 60 + seconds
+                except ValueError:
+                        pass
+        parsed = dp.parse(zulu)
+        # timestamps without a zone are UTC
+        if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return int(parsed.timestamp())
+
+def diff_revision(revision, before, after):
+        '''Adds words of after missing from before to Added, and words of before missing from after to Removed'''
+        revision['Added'].extend(after.difference(before))
+        revision['Removed'].extend(before.difference(after))
+
+def in_window(seconds, window):
+        '''Whether a revision at seconds is kept, window is (min_timestamp, max_timestamp) or None for every revision'''
+        return window is None or (seconds > window[0] and seconds < window[1])
+
+def diff_revision_counts(revision, before, after):
+        '''Same as diff_revision for lists of the words of every line, a word is added or removed as many times as its count went up or down'''
+        removed, added = token_diff.diff_counts(before, after)
+        revision['Added'].extend(added)
+        revision['Removed'].extend(removed)
+
+def diff_revision_spans(revision, before, after):
+        '''Same as diff_revision for lists of the words of every line, every run of words removed or added in one place is one string'''
+        removed, added = token_diff.diff_spans(before, after)
+        revision['Added'].extend(added)
+        revision['Removed'].extend(removed)
+
+def text_lines(text):
+        return [line.split() for line in text.split('\n')]
+
+def text_words(text):
+        return set(text.split())
+
+# How the words of a revision are collected and diffed against the previous one
+#     collect : container filled while the text is read, with add(container, words of a line)
+#     from_text : returns the filled container of a whole text
+DiffMode = namedtuple('DiffMode', ['collect', 'add', 'from_text', 'diff'])
+DIFF_MODES = {
+        'set' : DiffMode(set, set.update, text_words, diff_revision),
+        'counts' : DiffMode(list, list.append, text_lines, diff_revision_counts),
+        'spans' : DiffMode(list, list.append, text_lines, diff_revision_spans),
+}
+
+def finish_revision(revision, before, after, mode=DIFF_MODES['set']):
+        '''
+        Diffs a finished revision and returns what to keep as the previous revision
+        revision : timestamp entry to fill, or None if the revision is outside the window
+        before : what the previous revision kept, its text as a string if it was outside the window
+        after : words collected by mode or the text as a string, or list of text lines if the revision is outside the window
+        Revisions outside the window are only split into words if the next revision needs them
+        '''
+        if revision is None:
+                return '\n'.join(after)
+        if isinstance(before, str):
+                before = mode.from_text(before)
+        if isinstance(after, str):
+                after = mode.from_text(after)
+        mode.diff(revision, before, after)
+        return after
+
+def finish_text_revision(revision, before, after, mode=DIFF_MODES['set']):
+        '''Same as finish_revision, for a revision always given as a list of text lines'''
+        return finish_revision(revision, before, after if revision is None else '\n'.join(after), mode)
+
+def wikitext_mode(mode):
+        '''Same diff mode, with wikitext markup cleaned out of every text before it is split into words'''
+        return mode._replace(from_text=lambda text: mode.from_text(clean_wikitext(text)))
+
+def words_text(words):
+        '''Returns what finish_revision kept of a revision as text, which the diff mode's from_text turns back into the same words'''
+        if isinstance(words, str):
+                return words
+        if isinstance(words, set):
+                return ' '.join(sorted(words))
+        return '\n'.join(map(' '.join, words))
+
+def state_text(words, mode, wikitext=False):
+        '''Returns words_text of what finish_revision kept of the last revision, split by mode first if wikitext is cleaned and it is still text'''
+        if wikitext and isinstance(words, str):
+                words = mode.from_text(words)
+        return words_text(words)
+
+@lru_cache(maxsize=None)
+def open_page_states(states):
+        '''
+        PageStates of a state file, opened once in every worker process given its file name
+        Parses in the main process open their own with parse_stream, closed when they end
+        '''
+        return PageStates(states)
+
+def parse_lines(records_stream, window=None, page_filter=None, diff='set', states=None, page_ids=False, wikitext=False):
+        '''
+        Parses lines of xml in bytes, yielding (title, page dictionary) as each </page> closes
+        window : optional (min_timestamp, max_timestamp), revisions outside it are counted but not stored
+        page_filter : optional PageFilter, other pages are skipped without decoding their lines
+        diff : name of the DIFF_MODES used to fill Added and Removed
+        states, page_ids, wikitext : see parse_file
+        '''
+        mode = DIFF_MODES[diff]
+        if wikitext:
+                mode = wikitext_mode(mode)
+        add_words = mode.add
+        # cleaning needs the whole text of a revision, so its lines are kept as they are
+        finish = metrics.timed_function(partial(finish_text_revision if wikitext else finish_revision, mode=mode), 'diff')
+        page_states = open_page_states(states) if isinstance(states, str) else states
+        page = {}
         text_flag = False
+        skip_page = False # Page rejected by page_filter
         prev_tag = '' # Previous line - to differentiate between <id>'s
-        prev_str_builder = '' # Previous <text> revision
-        str_builder = '' # To get <text> from every revisions
+        prev_words = '' # Words of previous <text> revision, or its text if outside the window
+        words = mode.collect() # Words of current <text> revision, or its lines if outside the window
+        revision = None # Timestamp entry of current revision, None if outside the window
+        raw_text = False # Whether lines of current <text> revision are kept as they are
+        last_revision = None # ID of the last revision of the page taken in by an earlier run
         temp = '' # Title
         title_count = 0 # How many Wiki articles have been processed
         loading_signal = 0
@@ -59,6 +399,13 @@ def parse_file(data_file, file_type):
                         print(f'Loading...')
                         print(f'On article {temp} and have processed {title_count} articles')
                         loading_signal = 0
+
+                if skip_page:
+                        # Only look for the end of the page
+                        if string.lstrip().startswith(b'</page>'):
+                                skip_page = False
+                        continue
+
                 #var = string.decode('utf-8').strip()
                 var = string.decode().strip()
 
@@ -71,57 +418,60 @@ def parse_file(data_file, file_type):
 
                         # Stop adding text - revision done
                         if '</text>' in var:
-                                # str_builder += var.rstrip('</text>')
-                                str_builder += var[:-7]
+                                if raw_text:
+                                        words.append(var[:-7])
+                                else:
+                                        add_words(words, var[:-7].split())
 
-                                #print("Revision {} done. Full text is: {}.. FIN".format(revID, str_builder))
-        
                                 # Check for differences and add to dict
-                                before , after = prev_str_builder.split() , str_builder.split()
-                                added = set(after).difference(set(before))
-                                removed = set(before).difference(set(after))
-
-                                # Somehow if a and r are switched, it works..
-                                for a in added:
-                                #print('Added: ', a)
-                                # can convert a to words here
-                                        store[temp][ts]['Added'].append(a)
-
-                                for r in removed:
-                                #print('Removed: ', r)
-                                # can convert r to words here
-                                        store[temp][ts]['Removed'].append(r)
-
-                                '''
-                                for line in difflib.ndiff(prev_str_builder.split(), str_builder.split()):
-                                if line[0] == ' ': continue
-                                elif line[0] == '-': store[temp][ts]['Removed'].append(line[2:]) # removed from prev_str_builder - previous article
-                                elif line[0] == '+': store[temp][ts]['Added'].append(line[2:]) # add into str_builder - current article
-                                '''
-
-                                prev_str_builder = ''
-                                prev_str_builder = str_builder # Update to track previous <text>
+                                prev_words = finish(revision, prev_words, words) # Update to track previous <text>
 
                                 text_flag = False
                                 continue
                         
-                        # Keep adding text (revision)
-                        str_builder += var
-                        str_builder += '\n'
+                        # Keep adding text (revision), text lines are escaped so can not be tags
+                        if raw_text:
+                                words.append(var)
+                        else:
+                                add_words(words, var.split())
+                        continue
 
                 if var.startswith('<title>'):
                         title_count += 1
                         #title = var.rstrip('</title>').lstrip('<title>')
                         title = var[7:-8]
                         temp = title                
-                        store[temp] = {} # Put title in dict
-                        store[temp]['number of ts'] = 0 # Number of timestamps in dict
+                        page = {} # New dict for title
+                        prev_words = '' # First revision is diffed against an empty article
+                        last_revision = None
+                        page['number of ts'] = 0 # Number of timestamps in dict
+
+                elif var.startswith('</page>'):
+                        # Article done, hand it off
+                        if page_ids:
+                                page['page id'] = int(pageID)
+                        if page_states is not None:
+                                page['state'] = (int(revID), seconds, state_text(prev_words, mode, wikitext))
+                        yield temp, page
+
+                elif var.startswith('<ns>') and page_filter is not None:
+                        # Title and namespace are known, skip the page if it is not wanted
+                        if not page_filter(html.unescape(temp), int(var[4:-5])):
+                                skip_page = True
 
                 elif var.startswith('<id>') and prev_tag:
                         # Title/page ID
                         if prev_tag.startswith('<ns>'):
                                 #pageID = var.rstrip('</id>').lstrip('<id>')
                                 pageID = var[4:-5]
+                                if page_states is not None:
+                                        state = page_states.get(int(pageID))
+                                        if state is not None:
+                                                # carry on from the last revision an earlier run took in
+                                                last_revision, _, prev_words = state
+                                                if wikitext:
+                                                        # the state was cleaned already
+                                                        prev_words = DIFF_MODES[diff].from_text(prev_words)
 
                         # Revision ID
                         elif prev_tag.startswith('<revision>'):
@@ -135,31 +485,157 @@ def parse_file(data_file, file_type):
                 elif var.startswith('<timestamp>'):
                         #zulu = var.rstrip('</timestamp>').lstrip('<timestamp>')
                         zulu = var[11:-12]
-                        ts = dp.parse(zulu).strftime('%s')
+                        seconds = parse_timestamp(zulu)
+                        page['number of ts'] += 1
+                        revision = None
+                        if in_window(seconds, window) and (last_revision is None or int(revID) > last_revision):
+                                ts = str(seconds)
 
-                        # Every timestamp has a list of removed text and list of added texts
-                        store[temp][ts] = {}
-                        store[temp][ts]['Removed'] = []
-                        store[temp][ts]['Added'] = []
-                        store[temp]['number of ts'] += 1
+                                # Every timestamp has a list of removed text and list of added texts
+                                page[ts] = {}
+                                page[ts]['Removed'] = []
+                                page[ts]['Added'] = []
+                                revision = page[ts]
 
                 # elif var.startswith('<text xml:space="preserve">'):
                 elif var.startswith('<text '):
-                        text_flag = True
                         trim_from = var.find('>') + 1
                         # clean = var.lstrip('<text xml:space="preserve">') # Get first line of that text until \n
                         clean = var[trim_from:]
-                        #continue
-                        if clean:
-                                str_builder = ''
-                                str_builder += clean
-                                str_builder += '\n'
+                        # New revision
+                        raw_text = revision is None or wikitext
+                        words = [] if raw_text else mode.collect()
+                        if var[:trim_from].endswith('/>'):
+                                # Empty <text />, revision done
+                                prev_words = finish(revision, prev_words, words)
+                        elif clean.endswith('</text>'):
+                                # Whole text on one line, revision done
+                                if raw_text:
+                                        words.append(clean[:-7])
+                                else:
+                                        add_words(words, clean[:-7].split())
+                                prev_words = finish(revision, prev_words, words)
+                        else:
+                                text_flag = True
+                                if raw_text:
+                                        words.append(clean)
+                                else:
+                                        add_words(words, clean.split())
 
                 # Update previous line before next iteration
                 prev_tag = var
                 # time.sleep(0.01)
-                
-        return store
+
+def parse_events(records_stream, window=None, page_filter=None, diff='set', states=None, page_ids=False, wikitext=False):
+        '''
+        Parses chunks of xml in bytes with an incremental pull parser, yielding (title, page dictionary) as each </page> closes
+        Unlike parse_lines, does not depend on line layout, and entities are unescaped
+        window : optional (min_timestamp, max_timestamp), revisions outside it are counted but not stored
+        page_filter : optional PageFilter, the revisions of other pages are not split into words
+        diff : name of the DIFF_MODES used to fill Added and Removed
+        states, page_ids, wikitext : see parse_file
+        '''
+        mode = DIFF_MODES[diff]
+        if wikitext:
+                mode = wikitext_mode(mode)
+        finish = metrics.timed_function(partial(finish_revision, mode=mode), 'diff')
+        page_states = open_page_states(states) if isinstance(states, str) else states
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        root = None
+        page = {}
+        skip_page = False # Page rejected by page_filter
+        prev_words = '' # Words of previous <text> revision, or its text if outside the window
+        page_id = None
+        revision_id = 0
+        last_revision = None # ID of the last revision of the page taken in by an earlier run
+        text = ''
+        zulu = ''
+        title = ''
+        title_count = 0
+        for chunk in records_stream:
+                parser.feed(chunk)
+                for event, elem in parser.read_events():
+                        if event == 'start':
+                                if root is None:
+                                        root = elem
+                                continue
+
+                        # Strip the export namespace
+                        tag = elem.tag.rsplit('}', 1)[-1]
+                        if tag == 'title':
+                                title_count += 1
+                                title = elem.text or ''
+                                page = {}
+                                page['number of ts'] = 0
+                                prev_words = ''
+                                page_id = None
+                                last_revision = None
+                                skip_page = False
+
+                        elif tag == 'ns' and page_filter is not None:
+                                skip_page = not page_filter(title, int(elem.text))
+
+                        elif skip_page:
+                                # Nothing else of a skipped page is needed
+                                if tag == 'revision':
+                                        elem.clear()
+                                elif tag == 'page':
+                                        root.clear()
+
+                        elif tag == 'id' and page_id is None:
+                                # the first id of a page is its own, the others are in revisions
+                                page_id = int(elem.text)
+                                if page_states is not None:
+                                        state = page_states.get(page_id)
+                                        if state is not None:
+                                                last_revision, _, prev_words = state
+                                                if wikitext:
+                                                        # the state was cleaned already
+                                                        prev_words = DIFF_MODES[diff].from_text(prev_words)
+
+                        elif tag == 'timestamp':
+                                zulu = elem.text
+
+                        elif tag == 'text':
+                                text = elem.text or ''
+
+                        elif tag == 'revision':
+                                seconds = parse_timestamp(zulu)
+                                page['number of ts'] += 1
+                                if page_states is not None:
+                                        # a revision starts with its id
+                                        revision_id = int(elem[0].text)
+                                if in_window(seconds, window) and (last_revision is None or revision_id > last_revision):
+                                        ts = str(seconds)
+                                        page[ts] = {}
+                                        page[ts]['Removed'] = []
+                                        page[ts]['Added'] = []
+
+                                        # Check for differences and add to dict
+                                        prev_words = finish(page[ts], prev_words, text)
+                                else:
+                                        # Only split if the next revision needs it
+                                        prev_words = text
+
+                                text = ''
+                                elem.clear()
+
+                        elif tag == 'page':
+                                if page_ids:
+                                        page['page id'] = page_id
+                                if page_states is not None:
+                                        page['state'] = (revision_id, seconds, state_text(prev_words, mode, wikitext))
+                                yield title, page
+                                # Drop finished pages from the tree
+                                root.clear()
+                                if title_count % 100000 == 0:
+                                        print(f'Loading...')
+                                        print(f'On article {title} and have processed {title_count} articles')
+
+PARSE_ENGINES = {
+        'lines' : parse_lines,
+        'pull' : parse_events,
+}
 
 def main():
         '''Parse Command line options'''